@@ -71,6 +71,15 @@ const userSchema = new mongoose.Schema(
   type: String,
   default: ""
 },
+// Targeted alerts: companies / sectors the user follows (empty = all alerts)
+followed_companies: {
+  type: [String],
+  default: []
+},
+followed_sectors: {
+  type: [String],
+  default: []
+},
 totalTimeSpent: {
   type: Number,
   default: 0
@@ -5,25 +5,48 @@ import requests
 from datetime import datetime, timedelta, timezone
 from urllib.parse import quote
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
 from openai import OpenAI
 from pytz import timezone as pytz_timezone
 import hashlib
+import logging
+import time
+import threading
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+import numpy as np
 from rapidfuzz import process, fuzz
 
 import firebase_admin
 from firebase_admin import credentials, messaging
 
+from pti_text import compute_news_hash, normalize_article, remove_pti_references
+from llm_output import JSON_OBJECT_FORMAT, LLMOutputError, OutputParser, output_stats, record_repair_turn
+from tracing import (
+    prometheus_payload, push_metrics, set_span_outcome,
+    setup_logging, setup_otel, span, stage_stats
+)
+
 import re
+import sqlite3
+import pickle
+import random
+import queue
+import signal
 
 IST = pytz_timezone("Asia/Kolkata")
 
+log = logging.getLogger("agent1")
+
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 os.chdir(BASE_DIR)
 
-COMPANIES_CACHE = None
-COMPANY_LOOKUP_CACHE = None
+# Current company snapshot: {"version", "companies", "lookup", "choices"}.
+# Replaced as a whole (never mutated) so readers always see one consistent set.
+COMPANY_UNIVERSE = None
+COMPANY_UNIVERSE_LOCK = threading.Lock()
 
 
 
@@ -31,6 +54,8 @@ COMPANY_LOOKUP_CACHE = None
 # 🔧 CONFIGURATION
 # ================================
 load_dotenv()
+setup_logging()
+setup_otel()
 
 mongo_uri = os.getenv("MONGO_URI")
 db_name = os.getenv("DB_NAME")
@@ -56,6 +81,19 @@ openai_client = OpenAI(
     api_key=os.getenv("OPENAI_API_KEY")
 )
 
+# Retries 429/5xx with jittered backoff and adapts concurrency (AIMD) to the
+# rate-limit headers; shared with the chat gateway and AI overview server.
+sys.path.insert(0, os.path.abspath(os.path.join(BASE_DIR, "..", "..")))
+from mcp_server.llm_client import RateLimitedLLMClient, AIMDLimiter
+
+llm_client = RateLimitedLLMClient(
+    openai_client,
+    limiter=AIMDLimiter(
+        initial=int(os.getenv("LLM_INITIAL_CONCURRENCY", "8")),
+        maximum=int(os.getenv("LLM_MAX_CONCURRENCY", "32")),
+    ),
+)
+
 
 
 
@@ -76,40 +114,279 @@ if not firebase_admin._apps:
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 LAST_RUN_FILE = os.path.join(BASE_DIR, "last_run_time.txt")
 
+# ================================
+# 🏢 COMPANY UNIVERSE SNAPSHOT
+# ================================
+COMPANY_SNAPSHOT_FILE = os.path.join(BASE_DIR, "company_universe.pkl")
+COMPANY_REFRESH_SECONDS = int(os.getenv("COMPANY_REFRESH_SECONDS", "900"))
+COMPANY_SNAPSHOT_FORMAT = 1
+
+_company_refresher = None
+
+
+def company_data_version():
+    """Cheap fingerprint of Company_data: document count + newest _id."""
+    count = companies_col.count_documents({})
+    newest = companies_col.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    return f"{count}:{newest['_id'] if newest else ''}"
+
+
+def build_company_universe(version):
+    companies = list(
+        companies_col.find({}, {"SYMBOL": 1, "NAME OF COMPANY": 1, "_id": 0})
+    )
+    lookup = build_company_lookup(companies)
+    return {
+        "format": COMPANY_SNAPSHOT_FORMAT,
+        "version": version,
+        "companies": companies,
+        "lookup": lookup,
+        "choices": build_company_choices(lookup),
+    }
+
+
+def load_company_snapshot():
+    try:
+        with open(COMPANY_SNAPSHOT_FILE, "rb") as f:
+            universe = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log.warning(f"⚠️ Company snapshot unreadable, rebuilding: {e}")
+        return None
+
+    if not isinstance(universe, dict) or universe.get("format") != COMPANY_SNAPSHOT_FORMAT:
+        return None
+    return universe
+
+
+def save_company_snapshot(universe):
+    tmp_path = COMPANY_SNAPSHOT_FILE + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump(universe, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, COMPANY_SNAPSHOT_FILE)
+    except Exception as e:
+        log.warning(f"⚠️ Company snapshot not saved: {e}")
+
+
+def get_company_universe():
+    """Current snapshot. Warm start from disk, else one Company_data scan."""
+    global COMPANY_UNIVERSE
+
+    universe = COMPANY_UNIVERSE
+    if universe is not None:
+        return universe
+
+    # Pipeline workers may hit a cold cache at the same time; load it once.
+    with COMPANY_UNIVERSE_LOCK:
+        if COMPANY_UNIVERSE is None:
+            universe = load_company_snapshot()
+            if universe is not None:
+                log.info(f"🏢 Company universe warm start ({len(universe['companies'])} companies)")
+            else:
+                universe = build_company_universe(company_data_version())
+                save_company_snapshot(universe)
+                log.info(f"🏢 Company universe loaded from Mongo ({len(universe['companies'])} companies)")
+            COMPANY_UNIVERSE = universe
+
+    return COMPANY_UNIVERSE
+
+
+def refresh_company_universe():
+    """Rebuild and swap in a new snapshot if Company_data changed. Returns True on swap."""
+    global COMPANY_UNIVERSE
+
+    version = company_data_version()
+    current = get_company_universe()
+    if current["version"] == version:
+        return False
+
+    universe = build_company_universe(version)
+    save_company_snapshot(universe)
+
+    with COMPANY_UNIVERSE_LOCK:
+        COMPANY_UNIVERSE = universe
+
+    log.info(f"🏢 Company universe refreshed ({len(universe['companies'])} companies, version={version})")
+    return True
+
+
+def _company_refresh_loop(stop_event, interval):
+    # First check right away so a stale warm-start snapshot is replaced quickly
+    while True:
+        try:
+            refresh_company_universe()
+        except Exception as e:
+            log.warning(f"⚠️ Company universe refresh failed: {e}")
+
+        if stop_event.wait(interval):
+            return
+
+
+def start_company_refresher(interval=None):
+    """Start the background refresher once per process."""
+    global _company_refresher
+
+    if _company_refresher is not None and _company_refresher.is_alive():
+        return _company_refresher
+
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=_company_refresh_loop,
+        args=(stop_event, interval or COMPANY_REFRESH_SECONDS),
+        name="company-universe-refresher",
+        daemon=True,
+    )
+    thread.stop_event = stop_event
+    thread.start()
+    _company_refresher = thread
+    return thread
+
+
 def load_companies_cache():
-    global COMPANIES_CACHE, COMPANY_LOOKUP_CACHE
+    return get_company_universe()["lookup"]
 
-    if COMPANIES_CACHE is None:
-        COMPANIES_CACHE = list(
-            companies_col.find({}, {"SYMBOL": 1, "NAME OF COMPANY": 1, "_id": 0})
+
+# ================================
+# 📍 INGEST CHECKPOINT
+# ================================
+# Durable run state: the fetch watermark, the newest PTI PublishedAt seen and
+# every FileName already processed (kept, filtered or duplicate), so a
+# restarted worker resumes mid-window without re-running the LLM stages.
+INGEST_STATE_PATH = os.getenv("INGEST_STATE_PATH", os.path.join(BASE_DIR, "ingest_state.sqlite3"))
+INGEST_STATE_RETENTION_DAYS = int(os.getenv("INGEST_STATE_RETENTION_DAYS", "7"))
+# A failing article holds the watermark for this many runs, then is given up on
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+
+
+class IngestCheckpointStore:
+    """SQLite-backed watermark + processed FileName set."""
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingest_state (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
         )
-        COMPANY_LOOKUP_CACHE = build_company_lookup(COMPANIES_CACHE)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS processed_articles (
+                file_name TEXT PRIMARY KEY,
+                window_start TEXT,
+                outcome TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                processed_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS processed_articles_at ON processed_articles(processed_at)"
+        )
+        self.conn.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value FROM ingest_state WHERE key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO ingest_state (key, value) VALUES (?, ?)", (key, value)
+            )
+            self.conn.commit()
+
+    def mark_processed(self, article, outcome, window_start=None):
+        file_name = article.get("FileName")
+        if not file_name:
+            return
 
-    return COMPANY_LOOKUP_CACHE
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO processed_articles "
+                "(file_name, window_start, outcome, processed_at) VALUES (?, ?, ?, ?)",
+                (file_name, window_start.isoformat() if window_start else None, outcome, time.time())
+            )
+            self.conn.commit()
+
+    def mark_failed(self, article, window_start=None):
+        """Count a failed attempt. Returns True while the article should still be retried."""
+        file_name = article.get("FileName")
+        if not file_name:
+            return False
+
+        with self.lock:
+            self.conn.execute(
+                """
+                INSERT INTO processed_articles (file_name, window_start, outcome, attempts, processed_at)
+                VALUES (?, ?, 'failed', 1, ?)
+                ON CONFLICT(file_name) DO UPDATE SET
+                    attempts = attempts + 1,
+                    processed_at = excluded.processed_at
+                """,
+                (file_name, window_start.isoformat() if window_start else None, time.time())
+            )
+            attempts = self.conn.execute(
+                "SELECT attempts FROM processed_articles WHERE file_name = ?", (file_name,)
+            ).fetchone()[0]
+            self.conn.commit()
+
+        return attempts < INGEST_MAX_ATTEMPTS
+
+    def processed_among(self, file_names):
+        """Subset of file_names already processed (or failed too often to retry)."""
+        found = set()
+        file_names = list(file_names)
+        with self.lock:
+            # Stay under SQLite's bound-parameter limit
+            for i in range(0, len(file_names), 500):
+                chunk = file_names[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                found.update(
+                    row[0] for row in self.conn.execute(
+                        f"SELECT file_name FROM processed_articles WHERE file_name IN ({placeholders}) "
+                        f"AND (outcome != 'failed' OR attempts >= ?)",
+                        chunk + [INGEST_MAX_ATTEMPTS]
+                    )
+                )
+        return found
+
+    def prune(self, retention_days=None):
+        cutoff = time.time() - (retention_days or INGEST_STATE_RETENTION_DAYS) * 86400
+        with self.lock:
+            self.conn.execute("DELETE FROM processed_articles WHERE processed_at < ?", (cutoff,))
+            self.conn.commit()
+
+
+ingest_state = IngestCheckpointStore(INGEST_STATE_PATH)
+
+
+def _parse_checkpoint(value):
+    last_time = datetime.fromisoformat(value)
+    if last_time.tzinfo is None:
+        last_time = last_time.replace(tzinfo=IST)
+    return last_time.astimezone(IST)
 
 
 def get_last_run_time():
+    value = ingest_state.get("last_run_time")
+    if value:
+        return _parse_checkpoint(value)
+
+    # One-time migration from the old text-file watermark
     if os.path.exists(LAST_RUN_FILE):
         with open(LAST_RUN_FILE, "r") as f:
-            last_time_str = f.read().strip()
-            last_time = datetime.fromisoformat(last_time_str)
-            if last_time.tzinfo is None:
-                last_time = last_time.replace(tzinfo=IST)
-            return last_time.astimezone(IST)
+            return _parse_checkpoint(f.read().strip())
     return datetime.now(IST) - timedelta(minutes=30)
 
 def save_last_run_time(dt):
-    with open(LAST_RUN_FILE, "w") as f:
-        f.write(dt.isoformat())
-
-def compute_news_hash(article):
-    text = (
-        (article.get("Headline", "") + " " + article.get("story", ""))
-        .lower()
-        .strip()
-    )
-    text = re.sub(r"\s+", " ", text)
-    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+    ingest_state.set("last_run_time", dt.isoformat())
+
 
 
 # ================================
@@ -117,45 +394,85 @@ def compute_news_hash(article):
 # ================================
 
 
-def fetch_pti_news():
-    start_time = get_last_run_time()
-    end_time = datetime.now(IST)
+PTI_URL = "https://editorial.pti.in/ptiapi/webservice1.asmx/JsonFile1"
+PTI_CENTER_CODE = "17102025001RL"
+PTI_HEADERS = {
+    "User-Agent": "Mozilla/5.0",
+    "Accept": "application/json,text/plain,*/*",
+    "Connection": "keep-alive",
+}
+# Large gaps (e.g. after downtime) are split into fixed windows
+PTI_WINDOW_MINUTES = int(os.getenv("PTI_WINDOW_MINUTES", "30"))
+PTI_FETCH_CONCURRENCY = int(os.getenv("PTI_FETCH_CONCURRENCY", "3"))
+PTI_TIMEOUT_SECONDS = 30
+
+_pti_session = None
+_pti_session_lock = threading.Lock()
+
+
+def get_pti_session():
+    """One keep-alive session shared by all window fetches."""
+    global _pti_session
+    with _pti_session_lock:
+        if _pti_session is None:
+            _pti_session = requests.Session()
+            _pti_session.headers.update(PTI_HEADERS)
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(PTI_FETCH_CONCURRENCY, 1))
+            _pti_session.mount("https://", adapter)
+    return _pti_session
+
+
+def plan_fetch_windows(start_time, end_time, window_minutes=None):
+    """Split [start_time, end_time] into consecutive (start, end) windows."""
+    step = timedelta(minutes=window_minutes or PTI_WINDOW_MINUTES)
+    windows = []
+    cursor = start_time
+    while cursor < end_time:
+        window_end = min(cursor + step, end_time)
+        windows.append((cursor, window_end))
+        cursor = window_end
+    return windows
+
+
+def fetch_pti_window(start_time, end_time):
+    """Fetch one window. Returns a list of articles, or None if the request failed."""
+    with span("fetch", window_start=start_time.isoformat()) as fetch_span:
+        articles = _request_pti_window(start_time, end_time)
+        if articles is None:
+            fetch_span.set_outcome("failed")
+        else:
+            fetch_span.set(articles=len(articles))
+        return articles
+
 
+def _request_pti_window(start_time, end_time):
     from_time = quote(start_time.strftime("%Y/%m/%d %H:%M:%S"))
     to_time = quote(end_time.strftime("%Y/%m/%d %H:%M:%S"))
 
     url = (
-        "https://editorial.pti.in/ptiapi/webservice1.asmx/JsonFile1"
-        f"?centercode=17102025001RL"
+        f"{PTI_URL}"
+        f"?centercode={PTI_CENTER_CODE}"
         f"&FromTime={from_time}"
         f"&EndTime={to_time}"
     )
 
-    print(f"⏱ Fetching PTI news (IST): {start_time} → {end_time}")
+    log.debug(f"⏱ Fetching PTI news (IST): {start_time} → {end_time}")
 
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0",
-            "Accept": "application/json,text/plain,*/*",
-            "Connection": "keep-alive",
-        }
-        response = requests.get(url, headers=headers, timeout=30)
+        response = get_pti_session().get(url, timeout=PTI_TIMEOUT_SECONDS)
     except Exception as e:
-        print("❌ PTI request failed:", e)
-        return []
+        log.error(f"❌ PTI request failed: {e}")
+        return None
 
     if response.status_code != 200:
-        print("❌ PTI API HTTP error:", response.status_code)
-        print(response.text[:300])
-        return []
+        log.error(f"❌ PTI API HTTP error: {response.status_code} {response.text[:300]}")
+        return None
 
     try:
         data = response.json()
     except ValueError:
-        print("❌ PTI API returned NON-JSON response")
-        print("Response preview:")
-        print(response.text[:300])
-        return []
+        log.error(f"❌ PTI API returned NON-JSON response: {response.text[:300]}")
+        return None
 
     if isinstance(data, dict):
         articles = data.get("Table", [])
@@ -166,31 +483,628 @@ def fetch_pti_news():
 
     return articles
 
+
+def submit_window_fetches(pool, windows):
+    """Submit every window to pool. Returns {future: window_index}."""
+    return {
+        pool.submit(fetch_pti_window, start, end): index
+        for index, (start, end) in enumerate(windows)
+    }
+
+
+def fetch_pti_news():
+    """Fetch everything since the last checkpoint (all windows) as one list."""
+    windows = plan_fetch_windows(get_last_run_time(), datetime.now(IST))
+    results = [None] * len(windows)
+
+    with ThreadPoolExecutor(max_workers=max(PTI_FETCH_CONCURRENCY, 1)) as pool:
+        futures = submit_window_fetches(pool, windows)
+        for future in as_completed(futures):
+            results[futures[future]] = future.result() or []
+
+    return [article for window_articles in results for article in window_articles]
+
 # ================================
-# ⚙️ llm CALL HELPER
+# ♻️ PRE-LLM DEDUPE
 # ================================
-def get_llm_response(system_prompt, user_input):
+# FileNames / content hashes seen recently in this process, so overlapping
+# PTI windows don't even need a Mongo round trip. Oldest entries drop first.
+RECENT_SEEN_MAX = int(os.getenv("RECENT_SEEN_MAX", "20000"))
+_recent_seen = OrderedDict()
+_recent_seen_lock = threading.Lock()
+
+
+def remember_seen(*keys):
+    with _recent_seen_lock:
+        for key in keys:
+            if not key:
+                continue
+            _recent_seen[key] = True
+            _recent_seen.move_to_end(key)
+        while len(_recent_seen) > RECENT_SEEN_MAX:
+            _recent_seen.popitem(last=False)
+
+
+def drop_known_articles(articles):
+    """
+    Drop articles already stored (by FileName or content_hash) before any
+    LLM call. One bulk Mongo query covers the whole batch.
+    """
+    candidates = []
+    batch_keys = set()
+
+    for article in articles:
+        file_name = article.get("FileName")
+        if not file_name:
+            continue
+
+        content_hash = compute_news_hash(article)
+
+        # Same story repeated inside this batch
+        if file_name in batch_keys or content_hash in batch_keys:
+            continue
+        batch_keys.update((file_name, content_hash))
+
+        with _recent_seen_lock:
+            if file_name in _recent_seen or content_hash in _recent_seen:
+                continue
+
+        candidates.append((article, file_name, content_hash))
+
+    if not candidates:
+        return []
+
+    # Processed by an earlier (possibly interrupted) run, kept or not
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_input},
-            ],
-            temperature=0.0,
-        )
+        processed = ingest_state.processed_among(c[1] for c in candidates)
+    except sqlite3.Error as e:
+        log.warning(f"⚠️ Checkpoint lookup failed: {e}")
+        processed = set()
+    candidates = [c for c in candidates if c[1] not in processed]
 
-        return response.choices[0].message.content.strip()
+    if not candidates:
+        return []
+
+    file_names = [c[1] for c in candidates]
+    hashes = [c[2] for c in candidates]
 
+    known = set()
+    try:
+        for doc in filtered_news.find(
+            {
+                "$or": [
+                    {"FileName": {"$in": file_names}},
+                    {"content_hash": {"$in": hashes}}
+                ]
+            },
+            {"FileName": 1, "content_hash": 1, "_id": 0}
+        ):
+            known.add(doc.get("FileName"))
+            known.add(doc.get("content_hash"))
     except Exception as e:
-        print("❌ OpenAI Error:", e)
-        return None
+        # The unique content_hash index still rejects duplicate inserts
+        log.warning(f"⚠️ Bulk dedupe query failed: {e}")
+
+    remember_seen(*known)
+
+    return [
+        article for article, file_name, content_hash in candidates
+        if file_name not in known and content_hash not in known
+    ]
+
+
+# ================================
+# 🪞 NEAR-DUPLICATE INDEX (SimHash)
+# ================================
+# content_hash only catches byte-identical stories; PTI "UPDATE 2" / corrected
+# re-issues differ slightly. A 64-bit SimHash over word 3-shingles is kept for
+# recent stories and split into NEAR_DUP_MAX_HAMMING + 1 bands, so any story
+# within that Hamming distance shares at least one exact band bucket.
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_ENABLED", "1") == "1"
+NEAR_DUP_MAX_HAMMING = int(os.getenv("NEAR_DUP_MAX_HAMMING", "3"))
+NEAR_DUP_WINDOW_HOURS = int(os.getenv("NEAR_DUP_WINDOW_HOURS", "48"))
+NEAR_DUP_SYNC_SECONDS = int(os.getenv("NEAR_DUP_SYNC_SECONDS", "60"))
+
+SIMHASH_BITS = 64
+_SHINGLE_WORD_RE = re.compile(r"\w+")
+
+
+def simhash(text):
+    words = _SHINGLE_WORD_RE.findall(text.lower())
+    if len(words) >= 3:
+        shingles = [" ".join(words[i:i + 3]) for i in range(len(words) - 2)]
+    else:
+        shingles = words
+    if not shingles:
+        return 0
+
+    digests = b"".join(
+        hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest() for shingle in shingles
+    )
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(len(shingles), SIMHASH_BITS)
+    votes = bits.sum(axis=0) * 2 > len(shingles)
+    return int.from_bytes(np.packbits(votes).tobytes(), "big")
+
+
+def article_simhash(headline, story):
+    return simhash(f"{headline} {story}")
+
+
+class NearDuplicateIndex:
+    def __init__(self, max_hamming=None, window_hours=None):
+        self.max_hamming = NEAR_DUP_MAX_HAMMING if max_hamming is None else max_hamming
+        self.window = timedelta(hours=window_hours or NEAR_DUP_WINDOW_HOURS)
+
+        bands = self.max_hamming + 1
+        width = SIMHASH_BITS // bands
+        self.bands = [
+            (i * width, SIMHASH_BITS - i * width if i == bands - 1 else width)
+            for i in range(bands)
+        ]
+
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.entries = {}   # key → (fingerprint, added_at)
+        self.order = deque()
+        self.synced_until = None
+
+    def _band_keys(self, fingerprint):
+        return [
+            (band, (fingerprint >> shift) & ((1 << width) - 1))
+            for band, (shift, width) in enumerate(self.bands)
+        ]
+
+    def add(self, key, fingerprint, added_at=None):
+        added_at = added_at or datetime.now(timezone.utc)
+        with self.lock:
+            if key in self.entries:
+                return
+            self.entries[key] = (fingerprint, added_at)
+            self.order.append((added_at, key))
+            for band_key in self._band_keys(fingerprint):
+                self.buckets.setdefault(band_key, set()).add(key)
+
+    def find(self, fingerprint):
+        """Closest indexed key within max_hamming, as (key, distance), else None."""
+        best = None
+        with self.lock:
+            candidates = set()
+            for band_key in self._band_keys(fingerprint):
+                candidates |= self.buckets.get(band_key, set())
+
+            for key in candidates:
+                distance = bin(self.entries[key][0] ^ fingerprint).count("1")
+                if distance <= self.max_hamming and (best is None or distance < best[1]):
+                    best = (key, distance)
+        return best
+
+    def prune(self, now=None):
+        cutoff = (now or datetime.now(timezone.utc)) - self.window
+        with self.lock:
+            while self.order and self.order[0][0] < cutoff:
+                _, key = self.order.popleft()
+                fingerprint, _ = self.entries.pop(key)
+                for band_key in self._band_keys(fingerprint):
+                    bucket = self.buckets.get(band_key)
+                    if bucket is not None:
+                        bucket.discard(key)
+                        if not bucket:
+                            del self.buckets[band_key]
+
+    def sync(self, collection):
+        """Pull documents stored since the last sync (first call loads the whole window)."""
+        now = datetime.now(timezone.utc)
+        since = self.synced_until or (now - self.window)
+
+        cursor = collection.find(
+            {"ingested_at": {"$gt": since}},
+            {"content_hash": 1, "simhash": 1, "Headline": 1, "story": 1, "ingested_at": 1, "_id": 0}
+        ).sort("ingested_at", 1)
+
+        added = 0
+        for doc in cursor:
+            key = doc.get("content_hash")
+            if not key:
+                continue
+            fingerprint = (
+                int(doc["simhash"], 16) if doc.get("simhash")
+                else article_simhash(doc.get("Headline", ""), doc.get("story", ""))
+            )
+            ingested_at = doc.get("ingested_at") or now
+            if ingested_at.tzinfo is None:
+                ingested_at = ingested_at.replace(tzinfo=timezone.utc)
+            self.add(key, fingerprint, ingested_at)
+            added += 1
+
+        self.synced_until = now
+        self.prune(now)
+        return added
+
+
+near_dup_index = NearDuplicateIndex()
+_near_dup_last_sync = 0.0
+
+
+def drop_near_duplicates(articles, batch_index=None):
+    """
+    Split articles into (fresh, near_duplicates) against recent stored stories
+    and each other. near_duplicates holds (article, original FileName) pairs;
+    the FileName is None when the original is an already stored story.
+    Pass one batch_index per run so stories in different windows are
+    compared too. Each fresh article gets "_simhash" for the stored doc.
+    """
+    global _near_dup_last_sync
+
+    if not NEAR_DUP_ENABLED or not articles:
+        return articles, []
+
+    if time.monotonic() - _near_dup_last_sync > NEAR_DUP_SYNC_SECONDS:
+        try:
+            added = near_dup_index.sync(filtered_news)
+            _near_dup_last_sync = time.monotonic()
+            if added:
+                log.info(f"🪞 Near-duplicate index: +{added} stories ({len(near_dup_index.entries)} total)")
+        except Exception as e:
+            log.warning(f"⚠️ Near-duplicate index sync failed: {e}")
+
+    # Stories in this batch (run) are also compared with each other
+    if batch_index is None:
+        batch_index = NearDuplicateIndex(max_hamming=near_dup_index.max_hamming)
+
+    fresh, duplicates = [], []
+    for article in articles:
+        fingerprint = article_simhash(
+            remove_pti_references(article.get("Headline", "")),
+            remove_pti_references(article.get("story", ""))
+        )
+        stored_match = near_dup_index.find(fingerprint)
+        match = stored_match or batch_index.find(fingerprint)
+        if match:
+            log.debug(f"🪞 Near-duplicate (distance {match[1]}): {article.get('Headline','')[:80]}")
+            duplicates.append((article, None if stored_match else match[0]))
+            continue
+
+        batch_index.add(article.get("FileName"), fingerprint)
+        article["_simhash"] = fingerprint
+        fresh.append(article)
+
+    return fresh, duplicates
+
+
+# ================================
+# 🗄 LLM RESPONSE CACHE
+# ================================
+# Calls run at temperature 0.0, so a response for the same model + prompt +
+# input can be reused across reruns, crashes and backfills.
+LLM_MODEL = "gpt-4o-mini"
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(BASE_DIR, "llm_cache.sqlite3"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_HOURS", "168")) * 3600
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000"))
+LLM_CACHE_PRUNE_EVERY = 200
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """SQLite-backed response cache with TTL and max-size eviction."""
+
+    def __init__(self, path, ttl_seconds, max_entries):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.hits = 0
+        self.misses = 0
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache(last_used)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(model, system_prompt, user_input):
+        return _sha256(f"{model}\n{_sha256(system_prompt)}\n{_sha256(user_input)}")
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+
+            self.conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, response):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, now, now)
+            )
+            self.writes += 1
+            if self.writes % LLM_CACHE_PRUNE_EVERY == 0:
+                self._prune(now)
+            self.conn.commit()
+
+    def _prune(self, now):
+        self.conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        self.conn.execute(
+            """
+            DELETE FROM llm_cache WHERE key IN (
+                SELECT key FROM llm_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_entries,)
+        )
+
+
+llm_cache = None
+if LLM_CACHE_ENABLED:
+    try:
+        llm_cache = LLMResponseCache(LLM_CACHE_PATH, LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_ENTRIES)
+    except sqlite3.Error as e:
+        log.warning(f"⚠️ LLM cache disabled: {e}")
+
+
+# ================================
+# 📏 TOKEN ACCOUNTING & INPUT COMPACTION
+# ================================
+# Every LLM call records prompt/completion tokens and latency per stage and
+# article; records are flushed to the llm_usage collection once per run.
+# Compaction trims the story to its lead paragraphs within a token budget.
+PROMPT_COMPACTION = os.getenv("PROMPT_COMPACTION", "0") == "1"
+LLM_INPUT_TOKEN_BUDGET = int(os.getenv("LLM_INPUT_TOKEN_BUDGET", "600"))
+
+llm_usage_col = db["llm_usage"]
+
+try:
+    import tiktoken
+
+    _token_encoder = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _token_encoder = None
+
+
+def count_tokens(text):
+    if _token_encoder is not None:
+        return len(_token_encoder.encode(text))
+    # ~4 chars per token for English news copy
+    return (len(text) + 3) // 4
+
+
+_llm_context = threading.local()
+
+
+def set_llm_article(file_name):
+    """Tag LLM calls made on this thread with the article they belong to."""
+    _llm_context.article = file_name
+
+
+class LLMUsageRecorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = []
+
+    def record(self, stage, prompt_tokens, completion_tokens, latency_ms, cached=False, ok=True):
+        with self.lock:
+            self.records.append({
+                "FileName": getattr(_llm_context, "article", None),
+                "stage": stage,
+                "model": LLM_MODEL,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "latency_ms": round(latency_ms, 1),
+                "cached": cached,
+                "ok": ok,
+                "at": datetime.now(timezone.utc),
+            })
+
+    def summary(self):
+        per_stage = {}
+        with self.lock:
+            for r in self.records:
+                stats = per_stage.setdefault(
+                    r["stage"],
+                    {"calls": 0, "cached": 0, "prompt_tokens": 0, "completion_tokens": 0, "latency_ms": 0.0}
+                )
+                stats["calls"] += 1
+                stats["cached"] += int(r["cached"])
+                stats["prompt_tokens"] += r["prompt_tokens"]
+                stats["completion_tokens"] += r["completion_tokens"]
+                stats["latency_ms"] += r["latency_ms"]
+        return per_stage
+
+    def flush(self, collection=None):
+        with self.lock:
+            records, self.records = self.records, []
+        if not records:
+            return
+        try:
+            (collection if collection is not None else llm_usage_col).insert_many(records, ordered=False)
+        except Exception as e:
+            log.warning(f"⚠️ LLM usage flush failed: {e}")
+
+
+llm_usage = LLMUsageRecorder()
+
+
+def compact_story(story, budget=None):
+    """Lead paragraphs (then sentences) of the story that fit in budget tokens."""
+    budget = budget or LLM_INPUT_TOKEN_BUDGET
+    if count_tokens(story) <= budget:
+        return story
+
+    kept = []
+    used = 0
+    for paragraph in re.split(r"\n\s*\n|\n", story):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+
+        cost = count_tokens(paragraph)
+        if used + cost <= budget:
+            kept.append(paragraph)
+            used += cost
+            continue
+
+        # Fill what is left of the budget sentence by sentence
+        partial = []
+        for sentence in re.split(r"(?<=[.!?])\s+", paragraph):
+            cost = count_tokens(sentence)
+            if used + cost > budget:
+                break
+            partial.append(sentence)
+            used += cost
+        if partial:
+            kept.append(" ".join(partial))
+        break
+
+    # A single huge first sentence: hard cut by characters
+    if not kept:
+        return story[:budget * 4]
+    return "\n".join(kept)
+
+
+def article_llm_text(article, compact=None):
+    story = article.get("story", "")
+    if compact is None:
+        compact = PROMPT_COMPACTION
+    if compact:
+        story = compact_story(story)
+    return f"Title: {article.get('Headline','')}\n\nContent:\n{story}"
+
+
+# ================================
+# ⚙️ llm CALL HELPER
+# ================================
+# Output that fails parsing/validation gets this many repair turns (the
+# rejected reply plus the validator's error); after that the article goes
+# through the failed/checkpoint path
+LLM_OUTPUT_RETRIES = int(os.getenv("LLM_OUTPUT_RETRIES", "1"))
+
+
+def get_llm_response(system_prompt, user_input, response_format=None, stage="llm", parse=None):
+    """
+    Model text for (system_prompt, user_input), or None if the call failed.
+    With parse (an OutputParser) the parsed dict is returned instead; only
+    responses that parse are cached, and a bad one raises LLMOutputError.
+    """
+    with span(stage) as llm_span:
+        content = _call_llm(system_prompt, user_input, response_format, stage, llm_span, parse)
+        if content is None:
+            llm_span.set_outcome("failed")
+        return content
+
+
+def _call_llm(system_prompt, user_input, response_format, stage, llm_span, parse):
+    started = time.perf_counter()
+    cache_key = None
+    if llm_cache is not None:
+        cache_prompt = system_prompt
+        if response_format is not None:
+            cache_prompt += "\n" + json.dumps(response_format, sort_keys=True)
+        cache_key = LLMResponseCache.make_key(LLM_MODEL, cache_prompt, user_input)
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            try:
+                parsed = parse(cached) if parse is not None else cached
+            except LLMOutputError:
+                # Written before this schema existed: treat as a miss
+                parsed = None
+            if parsed is not None:
+                llm_usage.record(stage, 0, 0, (time.perf_counter() - started) * 1000, cached=True)
+                llm_span.set_outcome("cached")
+                return parsed
+
+    extra = {}
+    if response_format is not None:
+        extra["response_format"] = response_format
+
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_input},
+    ]
+    repair_turns = LLM_OUTPUT_RETRIES
+
+    while True:
+        try:
+            response = llm_client.chat_completion(
+                model=LLM_MODEL,
+                messages=messages,
+                temperature=0.0,
+                **extra,
+            )
+
+            content = response.choices[0].message.content.strip()
+
+        except Exception as e:
+            log.error(f"❌ OpenAI Error: {e}")
+            llm_usage.record(stage, 0, 0, (time.perf_counter() - started) * 1000, ok=False)
+            return None
+
+        usage = getattr(response, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        llm_usage.record(stage, prompt_tokens, completion_tokens, (time.perf_counter() - started) * 1000)
+        llm_span.add_tokens(prompt_tokens, completion_tokens)
+
+        if parse is None:
+            result = content
+            break
+        try:
+            result = parse(content)
+            break
+        except LLMOutputError as e:
+            log.warning(f"⚠️ {stage} output rejected: {e.reason} | {content[:200]}")
+            if repair_turns <= 0:
+                llm_span.set_outcome("invalid")
+                raise
+            # The same prompt at temperature 0 fails the same way: show the
+            # model its reply and what was wrong with it
+            repair_turns -= 1
+            record_repair_turn()
+            messages = messages + [
+                {"role": "assistant", "content": content},
+                {"role": "user", "content": (
+                    f"That reply was rejected: {e.reason}. "
+                    "Reply again with only the corrected JSON object."
+                )},
+            ]
+            started = time.perf_counter()
+
+    if cache_key is not None and content:
+        try:
+            llm_cache.set(cache_key, content)
+        except sqlite3.Error as e:
+            log.warning(f"⚠️ LLM cache write failed: {e}")
+
+    return result
 
 # ================================
 # ⚙️ notification CALL HELPER
 # ================================
 
-def send_push_notification(article, agent2, agent3):
+def build_push_message(article, agent3):
     title = "High Impact Market News"
 
     body = (
@@ -198,7 +1112,7 @@ def send_push_notification(article, agent2, agent3):
         f"Sentiment: {agent3['sentiment']} | Impact: {agent3['impact']}"
     )
 
-    message = messaging.Message(
+    return messaging.Message(
         notification=messaging.Notification(
             title=title,
             body=body,
@@ -213,53 +1127,367 @@ def send_push_notification(article, agent2, agent3):
         topic="market_alerts"
     )
 
+
+def send_push_notification(article, agent2, agent3):
     try:
-        messaging.send(message)
-        print("🔔 Push notification sent")
+        messaging.send(build_push_message(article, agent3))
+        log.debug("🔔 Push notification sent")
     except Exception as e:
-        print("❌ Push notification failed:", e)
-
-# def send_push_notification(article, agent2, agent3):
-#     title = "🚨 High Impact Market News"
-#     body = (
-#         f"{article.get('Headline')}\n"
-#         f"Sentiment: {agent3['sentiment']} | Impact: {agent3['impact']}"
-#     )
-
-#     # 🔥 ONLY USERS WHO ENABLED NOTIFICATIONS
-#     users = db["Users"].find(
-#         {
-#             "notifications": True,
-#             "fcmToken": {"$exists": True, "$ne": ""}
-#         },
-#         {"fcmToken": 1}
-#     )
-
-#     tokens = [u["fcmToken"] for u in users]
-
-#     if not tokens:
-#         print("🔕 No users eligible for notifications")
-#         return
-
-#     message = messaging.MulticastMessage(
-#         notification=messaging.Notification(
-#             title=title,
-#             body=body,
-#         ),
-#         data={
-#             "FileName": article.get("FileName", ""),
-#             "headline": article.get("Headline", ""),
-#             "sentiment": agent3["sentiment"],
-#             "impact": agent3["impact"]
-#         },
-#         tokens=tokens
-#     )
-
-#     try:
-#         response = messaging.send_multicast(message)
-#         print(f"🔔 Sent to {response.success_count} users")
-#     except Exception as e:
-#         print("❌ Push notification failed:", e)
+        log.error(f"❌ Push notification failed: {e}")
+
+
+# ================================
+# 📬 NOTIFICATION DISPATCHER
+# ================================
+# Alerts are queued and sent from a background worker so FCM latency never
+# blocks ingestion. Alerts arriving within NOTIFY_COALESCE_SECONDS are folded
+# into one digest message; batches go out through messaging.send_each.
+NOTIFY_COALESCE_SECONDS = float(os.getenv("NOTIFY_COALESCE_SECONDS", "5"))
+NOTIFY_DIGEST_MAX_ITEMS = int(os.getenv("NOTIFY_DIGEST_MAX_ITEMS", "5"))
+NOTIFY_MAX_RETRIES = int(os.getenv("NOTIFY_MAX_RETRIES", "3"))
+NOTIFY_BACKOFF_SECONDS = float(os.getenv("NOTIFY_BACKOFF_SECONDS", "1.0"))
+
+IMPACT_RANK = {"Very High": 0, "High": 1, "Mild": 2, "Negligible": 3}
+
+
+def send_with_retries(send, pending, what, on_retry=None):
+    """
+    send(pending) → (success_count, items to retry). Exceptions and returned
+    items are retried with jittered exponential backoff, NOTIFY_MAX_RETRIES
+    times at most. Returns (sent, items still unsent).
+    """
+    sent = 0
+    for attempt in range(NOTIFY_MAX_RETRIES + 1):
+        if attempt:
+            delay = NOTIFY_BACKOFF_SECONDS * (2 ** (attempt - 1))
+            time.sleep(delay + random.uniform(0, delay / 2))
+            if on_retry is not None:
+                on_retry(len(pending))
+
+        try:
+            success, pending = send(pending)
+        except Exception as e:
+            log.warning(f"⚠️ {what} failed (attempt {attempt + 1}): {e}")
+            continue
+
+        sent += success
+        if not pending:
+            break
+    return sent, pending
+
+
+def build_digest_message(alerts):
+    """One message for several (article, agent3) alerts, most impactful first."""
+    alerts = sorted(alerts, key=lambda a: IMPACT_RANK.get(a[1].get("impact"), 9))
+    if len(alerts) == 1:
+        return build_push_message(*alerts[0])
+
+    lines = [
+        f"• {article.get('Headline', '')[:90]} ({agent3['sentiment']})"
+        for article, agent3 in alerts
+    ]
+    lead_article, lead_agent3 = alerts[0]
+
+    return messaging.Message(
+        notification=messaging.Notification(
+            title=f"{len(alerts)} High Impact Market News",
+            body="\n".join(lines),
+        ),
+        data={
+            # The app opens the feed at "FileName"; point it at the lead story
+            "FileName": lead_article.get("FileName", ""),
+            "FileNames": ",".join(a.get("FileName", "") for a, _ in alerts),
+            "headline": lead_article.get("Headline", ""),
+            "sentiment": lead_agent3["sentiment"],
+            "impact": lead_agent3["impact"],
+            "digest_count": str(len(alerts)),
+        },
+        topic="market_alerts"
+    )
+
+
+class NotificationDispatcher:
+    def __init__(self, coalesce_seconds=None, digest_max_items=None, fanout=None):
+        self.fanout = fanout
+        self.coalesce_seconds = NOTIFY_COALESCE_SECONDS if coalesce_seconds is None else coalesce_seconds
+        self.digest_max_items = max(1, digest_max_items or NOTIFY_DIGEST_MAX_ITEMS)
+        self.queue = queue.Queue()
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+        self.worker = None
+        self.worker_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        with self.worker_lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+                self.worker.start()
+
+    def _count(self, key, n=1):
+        with self.stats_lock:
+            self.stats[key] += n
+
+    def enqueue(self, article, agent2, agent3):
+        self._count("queued")
+        self.queue.put((article, agent2, agent3))
+        self._ensure_worker()
+
+    def _run(self):
+        while True:
+            first = self.queue.get()
+            batch = [first]
+
+            # Collect whatever else arrives inside the coalescing window
+            deadline = time.monotonic() + self.coalesce_seconds
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                with span("notify", alerts=len(batch)):
+                    self._send_batch(batch)
+            except Exception as e:
+                log.error(f"❌ Notification batch failed: {e}")
+                self._count("failed", len(batch))
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _send_batch(self, alerts):
+        if self.fanout is not None:
+            # Per-user targeting: every alert has its own audience, no digest
+            for article, agent2, agent3 in alerts:
+                with self.stats_lock:
+                    self.stats.update(self.fanout.send(article, agent2, agent3))
+            return
+
+        alerts = [(article, agent3) for article, _, agent3 in alerts]
+        messages = [
+            build_digest_message(alerts[i:i + self.digest_max_items])
+            for i in range(0, len(alerts), self.digest_max_items)
+        ]
+        self._count("messages", len(messages))
+        if len(alerts) > 1:
+            self._count("coalesced", len(alerts) - len(messages))
+
+        def send(batch):
+            response = messaging.send_each(batch)
+            return response.success_count, [
+                msg for msg, resp in zip(batch, response.responses) if not resp.success
+            ]
+
+        sent, pending = send_with_retries(
+            send, messages, "FCM send_each", on_retry=lambda n: self._count("retries", n)
+        )
+        self._count("sent", sent)
+        if not pending:
+            log.info(f"🔔 Push notifications sent: {len(messages)} message(s) for {len(alerts)} alert(s)")
+            return
+
+        log.error(f"❌ Push notification failed after retries: {len(pending)} message(s)")
+        self._count("failed", len(pending))
+
+    def drain(self):
+        """Block until every queued alert has been sent (or given up on)."""
+        self.queue.join()
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.stats.clear()
+
+    def stats_snapshot(self):
+        with self.stats_lock:
+            return dict(self.stats)
+
+
+# ================================
+# 🎯 TARGETED FAN-OUT (per-user tokens)
+# ================================
+# NOTIFY_FANOUT_MODE=targeted sends each alert only to users who follow one of
+# the article's companies/sectors (plus users with no follows set), instead of
+# the market_alerts topic. Tokens are streamed from Users once into an
+# inverted index, refreshed periodically, and sent in 500-token shards.
+NOTIFY_FANOUT_MODE = os.getenv("NOTIFY_FANOUT_MODE", "topic")
+FANOUT_SHARD_SIZE = 500  # FCM multicast limit
+FANOUT_CONCURRENCY = int(os.getenv("FANOUT_CONCURRENCY", "4"))
+FANOUT_INDEX_REFRESH_SECONDS = int(os.getenv("FANOUT_INDEX_REFRESH_SECONDS", "600"))
+
+# FCM error codes meaning the token will never work again
+STALE_TOKEN_ERRORS = ("UnregisteredError", "SenderIdMismatchError")
+
+
+def _pref_key(value):
+    return normalize_company_name(value) if value else ""
+
+
+class UserPreferenceIndex:
+    """Inverted index: followed company/sector → FCM tokens."""
+
+    def __init__(self):
+        self.by_company = {}
+        self.by_sector = {}
+        self.unfiltered = set()  # users who follow nothing get every alert
+        self.built_at = 0.0
+        self.token_count = 0
+
+    @classmethod
+    def build(cls, users_col):
+        index = cls()
+        cursor = users_col.find(
+            {
+                "notifications": True,
+                "fcmToken": {"$exists": True, "$ne": ""}
+            },
+            {"fcmToken": 1, "followed_companies": 1, "followed_sectors": 1, "_id": 0},
+            batch_size=1000
+        )
+
+        tokens = set()
+        for user in cursor:
+            token = user["fcmToken"]
+            tokens.add(token)
+            companies = user.get("followed_companies") or []
+            sectors = user.get("followed_sectors") or []
+
+            if not companies and not sectors:
+                index.unfiltered.add(token)
+                continue
+            for company in companies:
+                index.by_company.setdefault(_pref_key(company), set()).add(token)
+            for sector in sectors:
+                index.by_sector.setdefault(_pref_key(sector), set()).add(token)
+
+        index.token_count = len(tokens)
+        index.built_at = time.monotonic()
+        return index
+
+    def tokens_for(self, agent2):
+        tokens = set(self.unfiltered)
+        for company in agent2.get("companies") or []:
+            tokens |= self.by_company.get(_pref_key(company), set())
+        for sector in (agent2.get("sector"), agent2.get("sector_override")):
+            if sector:
+                tokens |= self.by_sector.get(_pref_key(sector), set())
+        return tokens
+
+    def discard_tokens(self, stale):
+        self.unfiltered -= stale
+        for bucket in (self.by_company, self.by_sector):
+            for tokens in bucket.values():
+                tokens -= stale
+
+
+class TargetedFanout:
+    def __init__(self, users_col):
+        self.users_col = users_col
+        self.index = None
+        self.lock = threading.Lock()
+
+    def get_index(self):
+        with self.lock:
+            if self.index is None or time.monotonic() - self.index.built_at > FANOUT_INDEX_REFRESH_SECONDS:
+                self.index = UserPreferenceIndex.build(self.users_col)
+                log.info(f"🎯 Fan-out index built: {self.index.token_count} tokens")
+            return self.index
+
+    def _send_shard(self, article, agent3, tokens):
+        """
+        Multicast to one shard with the dispatcher's retry/backoff. Only
+        failed tokens are re-sent; stale ones are dropped, not retried.
+        Returns (sent, failed, stale tokens, retried tokens).
+        """
+        stale = set()
+        retried = Counter()
+
+        def send(pending):
+            success, failed, shard_stale = self._multicast(article, agent3, pending)
+            stale.update(shard_stale)
+            return success, [token for token in failed if token not in shard_stale]
+
+        sent, pending = send_with_retries(
+            send, tokens, "Multicast shard", on_retry=lambda n: retried.update(tokens=n)
+        )
+        return sent, len(pending) + len(stale), stale, retried["tokens"]
+
+    def _multicast(self, article, agent3, tokens):
+        message = messaging.MulticastMessage(
+            notification=messaging.Notification(
+                title="High Impact Market News",
+                body=(
+                    f"{article.get('Headline')}\n"
+                    f"Sentiment: {agent3['sentiment']} | Impact: {agent3['impact']}"
+                ),
+            ),
+            data={
+                "FileName": article.get("FileName", ""),
+                "headline": article.get("Headline", ""),
+                "sentiment": agent3["sentiment"],
+                "impact": agent3["impact"]
+            },
+            tokens=tokens
+        )
+        response = messaging.send_each_for_multicast(message)
+
+        failed = [token for token, resp in zip(tokens, response.responses) if not resp.success]
+        stale = {
+            token for token, resp in zip(tokens, response.responses)
+            if not resp.success and type(resp.exception).__name__ in STALE_TOKEN_ERRORS
+        }
+        return response.success_count, failed, stale
+
+    def send(self, article, agent2, agent3):
+        """Fan one alert out to matching users. Returns a Counter of delivery stats."""
+        stats = Counter()
+        index = self.get_index()
+        tokens = sorted(index.tokens_for(agent2))
+        if not tokens:
+            log.info("🔕 No users eligible for notifications")
+            return stats
+
+        shards = [tokens[i:i + FANOUT_SHARD_SIZE] for i in range(0, len(tokens), FANOUT_SHARD_SIZE)]
+        stale = set()
+
+        with ThreadPoolExecutor(max_workers=max(1, FANOUT_CONCURRENCY)) as pool:
+            futures = {pool.submit(self._send_shard, article, agent3, shard): shard for shard in shards}
+            for future in as_completed(futures):
+                success, failure, shard_stale, retried = future.result()
+                if failure > len(shard_stale):
+                    log.error(f"❌ Multicast shard: {failure - len(shard_stale)} token(s) failed after retries")
+                stats["sent"] += success
+                stats["failed"] += failure
+                stats["retries"] += retried
+                stale |= shard_stale
+
+        stats["messages"] += len(shards)
+        if stale:
+            self.prune_tokens(stale)
+            stats["pruned"] += len(stale)
+
+        log.info(f"🎯 Sent to {stats['sent']} users in {len(shards)} shard(s)")
+        return stats
+
+    def prune_tokens(self, stale):
+        try:
+            self.users_col.update_many(
+                {"fcmToken": {"$in": list(stale)}},
+                {"$set": {"fcmToken": ""}}
+            )
+        except Exception as e:
+            log.warning(f"⚠️ Stale token prune failed: {e}")
+        with self.lock:
+            if self.index is not None:
+                self.index.discard_tokens(stale)
+
+
+notifier = NotificationDispatcher(
+    fanout=TargetedFanout(db["Users"]) if NOTIFY_FANOUT_MODE == "targeted" else None
+)
+
 
 # ================================
 # 🧠 AGENT 1: NEWS FILTER
@@ -300,12 +1528,196 @@ Do not add any extra commentary.
 """
 
 
-def process_agent1(article):
-    text = f"Title: {article.get('Headline','')}\n\nContent:\n{article.get('story','')}"
-    result = get_llm_response(agent1_prompt, text)
-    if not result:
+AGENT1_OUTPUT = OutputParser("agent1", {
+    "type": "object",
+    "required": ["decision"],
+    "properties": {
+        "decision": {"type": "string", "enum": ["keep", "discard"]},
+        "reason": {"type": "string"},
+    },
+})
+
+
+def process_agent1(article, compact=None):
+    text = article_llm_text(article, compact)
+    return get_llm_response(
+        agent1_prompt, text, response_format=JSON_OBJECT_FORMAT, stage="agent1", parse=AGENT1_OUTPUT
+    )
+
+# ================================
+# 🧹 LOCAL PRE-FILTER (before Agent 1)
+# ================================
+# Cheap CPU-only rules (plus an optional TF-IDF + linear model) that settle
+# obvious cases. Anything uncertain still goes to the Agent 1 LLM call.
+# Off by default: the discard rules are not yet validated against labelled
+# data, and a discarded article is never stored or alerted on.
+PREFILTER_ENABLED = os.getenv("PREFILTER_ENABLED", "0") == "1"
+PREFILTER_MODEL_PATH = os.getenv("PREFILTER_MODEL_PATH", os.path.join(BASE_DIR, "prefilter_model.joblib"))
+PREFILTER_MODEL_CONFIDENCE = float(os.getenv("PREFILTER_MODEL_CONFIDENCE", "0.97"))
+PREFILTER_MIN_WORDS = 40
+
+PREFILTER_MARKET_RE = re.compile(
+    r"\b(sensex|nifty|bse|nse|sebi|rbi|ipo|shares?|stocks?|equit(y|ies)|investors?|"
+    r"profit|revenue|earnings|ebitda|dividend|crore|market cap|rupee|forex|"
+    r"inflation|gdp|repo rate|acquisition|merger|stake|order|contract|"
+    r"rights|sponsor|brand|valuation|listing|bonds?|fii|dii)\b",
+    re.IGNORECASE
+)
+
+PREFILTER_DISCARD_RULES = [
+    ("newsalert", re.compile(r"^\s*(newsalert|news alert|flash)\b", re.IGNORECASE)),
+    ("sports", re.compile(
+        r"\b(cricket|ipl|t20|odi|wicket|innings|hockey|football|fifa|olympics?|"
+        r"tennis|badminton|wrestl\w*|kabaddi|chess|grand slam|world cup|medal)\b",
+        re.IGNORECASE
+    )),
+    ("entertainment", re.compile(
+        r"\b(bollywood|box office|film|movie|actor|actress|trailer|web series|"
+        r"ott release|singer|album|celebrity)\b",
+        re.IGNORECASE
+    )),
+    ("obituary", re.compile(
+        r"\b(passes away|passed away|dies at|died at|obituary|condolences?|"
+        r"last rites|cremated|mourns)\b",
+        re.IGNORECASE
+    )),
+    ("price_list", re.compile(
+        r"^\s*(bullion|pepper|copra|edible oils?|forex rates?|grain|sugar|"
+        r"spices?|metal) (rates?|prices?|market)\b",
+        re.IGNORECASE
+    )),
+]
+
+PREFILTER_KEEP_RULES = [
+    ("quarterly_results", re.compile(
+        r"\b(q[1-4]|quarterly|fourth[- ]quarter|third[- ]quarter|second[- ]quarter|"
+        r"first[- ]quarter)\b.*\b(net profit|profit|revenue|loss|earnings)\b",
+        re.IGNORECASE
+    )),
+    ("market_close", re.compile(
+        r"\b(sensex|nifty)\b.*\b(jumps?|climbs?|rises?|surges?|falls?|drops?|"
+        r"tanks?|slumps?|declines?|gains?|ends?|settles?|closes?)\b",
+        re.IGNORECASE
+    )),
+    ("rbi_policy", re.compile(r"\brbi\b.*\b(repo rate|policy rate|monetary policy)\b", re.IGNORECASE)),
+]
+
+_prefilter_model = None
+if PREFILTER_ENABLED and os.path.exists(PREFILTER_MODEL_PATH):
+    try:
+        import joblib
+
+        # Expected: a fitted sklearn Pipeline (e.g. TfidfVectorizer + LogisticRegression)
+        # with predict_proba and classes_ == ["discard", "keep"]
+        _prefilter_model = joblib.load(PREFILTER_MODEL_PATH)
+        log.info(f"🧹 Pre-filter model loaded: {PREFILTER_MODEL_PATH}")
+    except Exception as e:
+        log.warning(f"⚠️ Pre-filter model not loaded: {e}")
+
+prefilter_stats = Counter()
+_prefilter_stats_lock = threading.Lock()
+
+
+def _record_prefilter(outcome):
+    with _prefilter_stats_lock:
+        prefilter_stats[outcome] += 1
+
+
+# Normalized company names of the current universe, rebuilt when its version changes
+_prefilter_names = (None, frozenset(), 0)
+_prefilter_names_lock = threading.Lock()
+
+
+def _known_company_names():
+    """(names, longest name in words) for the current company universe."""
+    global _prefilter_names
+    universe = get_company_universe()
+    with _prefilter_names_lock:
+        if _prefilter_names[0] != universe["version"]:
+            names = frozenset(
+                name for name in (
+                    normalize_company_name(c.get("NAME OF COMPANY") or "") for c in universe["companies"]
+                ) if name
+            )
+            longest = max((len(name.split()) for name in names), default=0)
+            _prefilter_names = (universe["version"], names, longest)
+        return _prefilter_names[1], _prefilter_names[2]
+
+
+def mentions_known_company(text):
+    """True if any run of words in text is a listed company's normalized name."""
+    names, longest = _known_company_names()
+    words = [w.strip(".,;:!?'\"()[]") for w in normalize_company_name(text).split()]
+    for start in range(len(words)):
+        for size in range(1, min(longest, len(words) - start) + 1):
+            if " ".join(words[start:start + size]) in names:
+                return True
+    return False
+
+
+def _prefilter_decision(headline, story):
+    """(decision, reason) from the rules/model, or None."""
+    lead = story[:600]
+    market_hit = PREFILTER_MARKET_RE.search(headline) or PREFILTER_MARKET_RE.search(lead)
+
+    if not market_hit:
+        if len(story.split()) < PREFILTER_MIN_WORDS:
+            return "discard", "prefilter: short, no market content"
+
+        for label, pattern in PREFILTER_DISCARD_RULES:
+            if pattern.search(headline):
+                return "discard", f"prefilter: {label}"
+    else:
+        # Headline-only alerts and price tables are discarded even if they name a market term
+        for label, pattern in PREFILTER_DISCARD_RULES:
+            if label in ("newsalert", "price_list") and pattern.search(headline):
+                return "discard", f"prefilter: {label}"
+
+        if len(story.split()) >= PREFILTER_MIN_WORDS:
+            for label, pattern in PREFILTER_KEEP_RULES:
+                if pattern.search(headline):
+                    return "keep", f"prefilter: {label}"
+
+    if _prefilter_model is not None:
+        try:
+            proba = _prefilter_model.predict_proba([f"{headline}\n{story}"])[0]
+            classes = list(_prefilter_model.classes_)
+            best = max(range(len(classes)), key=lambda i: proba[i])
+            if proba[best] >= PREFILTER_MODEL_CONFIDENCE:
+                return classes[best], f"prefilter: model {proba[best]:.2f}"
+        except Exception as e:
+            log.warning(f"⚠️ Pre-filter model error: {e}")
+
+    return None
+
+
+def prefilter_article(article):
+    """
+    Returns an Agent 1 style dict ({"decision", "reason"}) when the local
+    rules/model are confident, else None (escalate to the LLM).
+    Articles naming a listed company are never discarded locally: a
+    promoter's death or a plant accident is still market news.
+    """
+    if not PREFILTER_ENABLED:
         return None
-    return json.loads(result)
+
+    headline = article.get("Headline", "") or ""
+    story = article.get("story", "") or ""
+
+    result = _prefilter_decision(headline, story)
+    if result is not None and result[0] == "discard" and mentions_known_company(f"{headline}\n{story}"):
+        log.debug(f"🧹 Pre-filter discard ({result[1]}) overridden, names a listed company: {headline[:60]}")
+        _record_prefilter("company_exempt")
+        result = None
+
+    if result is None:
+        _record_prefilter("escalated")
+        return None
+
+    decision, reason = result
+    _record_prefilter(decision)
+    return {"decision": decision, "reason": reason}
+
 
 # ================================
 # 🧠 AGENT 2: SUMMARY & COMPANY TAGGING
@@ -560,62 +1972,114 @@ def build_company_lookup(companies_data):
 
     return lookup
 
-def match_llm_companies_to_db(llm_companies, company_lookup, threshold=85):
-    matched = set()
+def build_company_choices(company_lookup):
+    """Precomputed (already normalized) choice array for batch matching."""
+    return list(company_lookup.keys())
 
-    for llm_name in llm_companies:
-        key = normalize_llm_name(llm_name)
 
+def match_llm_companies_batch(llm_company_lists, company_lookup, threshold=85, choices=None, workers=-1):
+    """
+    Match the extracted names of many articles in one process.cdist pass.
+    Takes a list of name lists and returns a list of matched-company lists
+    (same result as calling match_llm_companies_to_db per article).
+    workers is cdist's thread count (-1 = all cores).
+    """
+    if choices is None:
+        universe = COMPANY_UNIVERSE
+        if universe is not None and company_lookup is universe["lookup"]:
+            choices = universe["choices"]
+    if choices is None:
+        choices = build_company_choices(company_lookup)
+
+    queries = []
+    owners = []
+    for idx, llm_companies in enumerate(llm_company_lists):
+        for llm_name in llm_companies:
+            queries.append(normalize_llm_name(llm_name))
+            owners.append((idx, llm_name))
+
+    results = [set() for _ in llm_company_lists]
+    if not queries or not choices:
+        for _, llm_name in owners:
+            log.debug(f"❌ No DB match for: '{llm_name}'")
+        return [list(r) for r in results]
+
+    scores = process.cdist(
+        queries,
+        choices,
+        scorer=fuzz.token_sort_ratio,
+        workers=workers
+    )
+    # argmax keeps the first best choice, same tie-break as extractOne
+    best_idx = scores.argmax(axis=1)
 
-        best = process.extractOne(
-            key,
-            company_lookup.keys(),
-            scorer=fuzz.token_sort_ratio
-        )
+    for row, (idx, llm_name) in enumerate(owners):
+        best_choice = choices[best_idx[row]]
+        best_score = scores[row, best_idx[row]]
 
-        if best and best[1] >= threshold:
-            matched.add(company_lookup[best[0]])
-            print(f"✅ Matched: '{llm_name}' → '{company_lookup[best[0]]}' ({best[1]})")
+        if best_score >= threshold:
+            results[idx].add(company_lookup[best_choice])
+            log.debug(f"✅ Matched: '{llm_name}' → '{company_lookup[best_choice]}' ({best_score})")
         else:
-            print(f"❌ No DB match for: '{llm_name}'")
-
-    return list(matched)
+            log.debug(f"❌ No DB match for: '{llm_name}'")
 
+    return [list(r) for r in results]
 
-def process_agent2a(article):
-    text = f"Title: {article.get('Headline','')}\n\nContent:\n{article.get('story','')}"
-    result = get_llm_response(agent2a_prompt, text)
 
-    if not result:
-        return None
-
-    try:
-        return json.loads(result)
-    except:
-        print("⚠️ Agent2A JSON error")
-        return None
-
-
-
-def process_agent2(article):
-    text = f"Title: {article.get('Headline','')}\n\nContent:\n{article.get('story','')}"
+def match_llm_companies_to_db(llm_companies, company_lookup, threshold=85):
+    # Runs on a pipeline worker per article: one cdist thread each, or
+    # PIPELINE_MAX_WORKERS all-core passes would oversubscribe the CPU
+    return match_llm_companies_batch([llm_companies], company_lookup, threshold, workers=1)[0]
+
+
+AGENT2A_OUTPUT = OutputParser("agent2a", {
+    "type": "object",
+    "required": ["news_type", "companies"],
+    "properties": {
+        "news_type": {"type": "string", "enum": ["stock", "commodity"]},
+        "companies": {"type": "array", "items": {"type": "string"}},
+        "sector": {"type": "string"},
+        "commodities": {"type": "array", "items": {"type": "string"}},
+    },
+})
+
+AGENT2_OUTPUT = OutputParser("agent2", {
+    "type": "object",
+    "required": ["summary", "sector", "global", "commodities"],
+    "properties": {
+        "summary": {"type": "string"},
+        "sector": {"type": "string"},
+        "global": {"type": "boolean"},
+        "commodities": {"type": "boolean"},
+    },
+})
+
+
+def process_agent2a(article, compact=None):
+    text = article_llm_text(article, compact)
+    return get_llm_response(
+        agent2a_prompt, text, response_format=JSON_OBJECT_FORMAT, stage="agent2a", parse=AGENT2A_OUTPUT
+    )
 
-    # 2️⃣ Agent 2A → raw company mentions
-    agent2a_data = process_agent2a(article)
 
-    if not agent2a_data:
-        return None
 
+def resolve_agent2a_entities(agent2a_data):
+    """
+    Validate Agent 2A companies against Company_data and apply the
+    stock/commodity/sector rules. Returns (companies, sector, commodities).
+    """
     news_type = agent2a_data.get("news_type")
     llm_companies = agent2a_data.get("companies", [])
     llm_sector = agent2a_data.get("sector", "")
     llm_commodities = agent2a_data.get("commodities", [])
 
-    print(f"\n🧠 LLM extracted companies: {llm_companies}")
+    log.debug(f"🧠 LLM extracted companies: {llm_companies}")
 
     # 3️⃣ Build lookup + fuzzy match
     company_lookup = load_companies_cache()
-    validated_companies = match_llm_companies_to_db(llm_companies, company_lookup)
+    with span("match", names=len(llm_companies)) as match_span:
+        validated_companies = match_llm_companies_to_db(llm_companies, company_lookup)
+        match_span.set(matched=len(validated_companies))
 
     final_sector = ""
     final_commodities = []
@@ -636,6 +2100,20 @@ def process_agent2(article):
         else:
             final_sector = ""
 
+    return final_companies, final_sector, final_commodities
+
+
+def process_agent2(article, compact=None):
+    text = article_llm_text(article, compact)
+
+    # 2️⃣ Agent 2A → raw company mentions
+    agent2a_data = process_agent2a(article, compact)
+
+    if not agent2a_data:
+        return None
+
+    final_companies, final_sector, final_commodities = resolve_agent2a_entities(agent2a_data)
+
     # 4️⃣ Call Agent 2 for summary & sector
     llm_input = f"""
     Article:
@@ -652,15 +2130,10 @@ def process_agent2(article):
     """
 
 
-    result = get_llm_response(agent2_prompt, llm_input)
-    if not result:
-        return None
-
-    try:
-        agent2_data = json.loads(result)
-    except json.JSONDecodeError:
-        print("⚠️ Agent2 JSON error")
-        print(result)
+    agent2_data = get_llm_response(
+        agent2_prompt, llm_input, response_format=JSON_OBJECT_FORMAT, stage="agent2", parse=AGENT2_OUTPUT
+    )
+    if not agent2_data:
         return None
 
     # 5️⃣ FORCE companies to validated list only
@@ -716,6 +2189,20 @@ Analyze the summarized article and estimate:
 Return JSON only, no extra commentary.
 """
 
+SENTIMENTS = ["Very Bullish", "Bullish", "Neutral", "Bearish", "Very Bearish"]
+IMPACTS = ["Very High", "High", "Mild", "Negligible"]
+
+AGENT3_OUTPUT = OutputParser("agent3", {
+    "type": "object",
+    "required": ["sentiment", "impact"],
+    "properties": {
+        "sentiment": {"type": "string", "enum": SENTIMENTS},
+        "impact": {"type": "string", "enum": IMPACTS},
+        "rationale": {"type": "string"},
+    },
+})
+
+
 def process_agent3(agent2_data):
     input_text = (
         f"Summary: {agent2_data['summary']}\n"
@@ -723,10 +2210,118 @@ def process_agent3(agent2_data):
         f"Companies: {', '.join(agent2_data.get('companies', []))}"
     )
 
-    result = get_llm_response(agent3_prompt, input_text)
-    if not result:
+    return get_llm_response(
+        agent3_prompt, input_text, response_format=JSON_OBJECT_FORMAT, stage="agent3", parse=AGENT3_OUTPUT
+    )
+
+# ================================
+# 🧠 FUSED AGENT 2A + 2 + 3 (single call)
+# ================================
+# Optional mode: one structured-output call replaces the three staged calls.
+# Companies are still validated with match_llm_companies_to_db afterwards.
+MARKET_SECTORS = [
+    "Nifty Bank", "Nifty IT", "Nifty Pharma", "Nifty FMCG", "Nifty Auto",
+    "Nifty Metal", "Nifty Energy", "Nifty Financial Services", "Nifty Realty",
+    "Nifty Oil & Gas",
+]
+ALLOWED_COMMODITIES = [
+    "GOLD", "SILVER", "CRUDE OIL", "NATURAL GAS", "COPPER",
+    "ALUMINIUM", "ZINC", "LEAD", "NICKEL",
+]
+fused_prompt = f"""
+You are the combined Entity Extraction, Summarization and Sentiment agent for Rupee Letter (India).
+Complete PART A, PART B and PART C below for the same article in ONE response.
+Ignore the output formats shown inside each part; return ONLY the combined JSON described at the end.
+
+## PART A — ENTITY EXTRACTION
+{agent2a_prompt}
+
+## PART B — SUMMARY & SECTOR
+For PART B, the "validated company list" is the companies you extracted in PART A.
+{agent2_prompt}
+
+## PART C — SENTIMENT & IMPACT
+Base PART C on your PART B summary, sector and companies.
+{agent3_prompt}
+
+### COMBINED OUTPUT (STRICT JSON)
+- news_type, companies, market_sector ("" if none), commodity_names → PART A
+- summary, sector, global, commodities → PART B
+- sentiment, impact, rationale → PART C
+"""
+
+FUSED_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "fused_news_analysis",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "additionalProperties": False,
+            "required": [
+                "news_type", "companies", "market_sector", "commodity_names",
+                "summary", "sector", "global", "commodities",
+                "sentiment", "impact", "rationale",
+            ],
+            "properties": {
+                "news_type": {"type": "string", "enum": ["stock", "commodity"]},
+                "companies": {"type": "array", "items": {"type": "string"}},
+                "market_sector": {"type": "string", "enum": MARKET_SECTORS + [""]},
+                "commodity_names": {
+                    "type": "array",
+                    "items": {"type": "string", "enum": ALLOWED_COMMODITIES},
+                },
+                "summary": {"type": "string"},
+                "sector": {"type": "string"},
+                "global": {"type": "boolean"},
+                "commodities": {"type": "boolean"},
+                "sentiment": {"type": "string", "enum": SENTIMENTS},
+                "impact": {"type": "string", "enum": IMPACTS},
+                "rationale": {"type": "string"},
+            },
+        },
+    },
+}
+
+FUSED_OUTPUT = OutputParser("fused", FUSED_RESPONSE_FORMAT["json_schema"]["schema"])
+
+
+def process_fused(article, compact=None):
+    """
+    Single-call replacement for process_agent2 + process_agent3.
+    Returns (agent2_data, agent3_data) shaped like the staged path, or None.
+    """
+    text = article_llm_text(article, compact)
+
+    data = get_llm_response(
+        fused_prompt, text, response_format=FUSED_RESPONSE_FORMAT, stage="fused", parse=FUSED_OUTPUT
+    )
+    if not data:
         return None
-    return json.loads(result)
+
+    final_companies, final_sector, final_commodities = resolve_agent2a_entities({
+        "news_type": data.get("news_type"),
+        "companies": data.get("companies", []),
+        "sector": data.get("market_sector", ""),
+        "commodities": data.get("commodity_names", []),
+    })
+
+    agent2_data = {
+        "summary": data["summary"],
+        "sector": data["sector"],
+        "global": data["global"],
+        "commodities": data["commodities"],
+        "companies": final_companies,
+        "sector_override": final_sector,
+        "commodities_override": final_commodities,
+    }
+    agent3_data = {
+        "sentiment": data["sentiment"],
+        "impact": data["impact"],
+        "rationale": data.get("rationale"),
+    }
+    return agent2_data, agent3_data
+
 
 def parse_pti_time(pti_time_str):
     try:
@@ -735,152 +2330,701 @@ def parse_pti_time(pti_time_str):
     except Exception:
         return None
 
-def remove_pti_references(text):
-    if not text:
-        return text
-
-    # Remove (PTI)
-    text = re.sub(r"\(PTI\)", "", text, flags=re.IGNORECASE)
-
-    # Remove sentences containing PTI
-    text = re.sub(r"[^.]*\bPTI\b[^.]*\.", "", text, flags=re.IGNORECASE)
-
-    # Remove "Press Trust of India"
-    text = re.sub(r"Press Trust of India", "", text, flags=re.IGNORECASE)
-
-    # 🔥 Remove trailing PTI bureau codes like: PTI NKD TRB TRB
-    text = re.sub(r"\bPTI\b[\sA-Z]{0,20}$", "", text.strip())
+# ================================
+# 💾 BULK WRITER
+# ================================
+BULK_WRITE_BATCH_SIZE = int(os.getenv("BULK_WRITE_BATCH_SIZE", "25"))
 
-    # 🔥 Remove standalone 2-4 letter uppercase codes at end
-    text = re.sub(r"\b[A-Z]{2,4}\b(?:\s+\b[A-Z]{2,4}\b)*$", "", text.strip())
 
-    # Clean extra whitespace
-    text = re.sub(r"\s+", " ", text).strip()
+class FilteredNewsWriter:
+    """
+    Buffers finished filtered_news documents and upserts them with one
+    unordered bulk_write keyed on content_hash.
+    """
 
-    return text
+    def __init__(self, collection=None, batch_size=None):
+        self.collection = collection if collection is not None else filtered_news
+        self.batch_size = max(1, batch_size or BULK_WRITE_BATCH_SIZE)
+        self.pending = []
+
+    def add(self, item):
+        """Queue an item holding a "doc". Returns True once the batch is full."""
+        self.pending.append(item)
+        return len(self.pending) >= self.batch_size
+
+    def flush(self):
+        """Write the buffer. Returns [(item, "inserted" | "duplicate" | "failed")]."""
+        items, self.pending = self.pending, []
+        if not items:
+            return []
+
+        ops = [
+            UpdateOne(
+                {"content_hash": item["doc"]["content_hash"]},
+                {"$setOnInsert": item["doc"]},
+                upsert=True
+            )
+            for item in items
+        ]
+
+        inserted = set()
+        errors = {}
+
+        with span("insert", docs=len(ops)) as insert_span:
+            try:
+                result = self.collection.bulk_write(ops, ordered=False)
+                inserted.update(result.upserted_ids.keys())
+            except BulkWriteError as e:
+                details = e.details or {}
+                inserted.update(u["index"] for u in details.get("upserted", []))
+                for err in details.get("writeErrors", []):
+                    errors[err["index"]] = err
+                insert_span.set_outcome("partial")
+            except Exception as e:
+                log.error(f"❌ Bulk insert failed: {e}")
+                insert_span.set_outcome("failed")
+                return [(item, "failed") for item in items]
+            insert_span.set(inserted=len(inserted))
+
+        outcomes = []
+        for index, item in enumerate(items):
+            if index in inserted:
+                outcomes.append((item, "inserted"))
+            elif index in errors:
+                # 11000 = unique content_hash index hit by a concurrent insert
+                if errors[index].get("code") == 11000:
+                    outcomes.append((item, "duplicate"))
+                else:
+                    log.error(f"❌ Insert failed: {errors[index].get('errmsg')}")
+                    outcomes.append((item, "failed"))
+            else:
+                # Matched an existing content_hash → $setOnInsert was a no-op
+                outcomes.append((item, "duplicate"))
 
+        log.debug(f"💾 Bulk write: {len(items)} docs, {len(inserted)} inserted")
+        return outcomes
 
 
 # ================================
 # 🚀 PIPELINE RUNNER
 # ================================
-def run_pipeline():
-    articles = fetch_pti_news()
+# Max articles in flight at once. Each article still runs its stages
+# (agent1 → agent2a → agent2 → agent3 → insert) in order on one worker.
+PIPELINE_MAX_WORKERS = int(os.getenv("PIPELINE_MAX_WORKERS", "8"))
+# How often a run blocked on fetches/articles checks for a stop request
+STOP_POLL_SECONDS = 1.0
 
-    fetched_count = len(articles)
-    stored_count = 0
-    filtered_count = 0
+# "staged" = agent2a → agent2 → agent3 (3 calls), "fused" = process_fused (1 call)
+PIPELINE_MODES = ("staged", "fused")
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "staged")
 
-    print(f"📊 Fetched: {fetched_count} articles")
+# One-shot (cron) runs push stage metrics here; the daemon is scraped instead
+METRICS_PUSHGATEWAY = os.getenv("METRICS_PUSHGATEWAY")
 
-    for article in articles:
-        file_name = article.get("FileName")
-        if not file_name:
-            continue
 
+def process_article(article, mode="staged", compact=None):
+    """
+    Run one article through all agents; compact overrides PROMPT_COMPACTION.
+    Returns (outcome, pending_write); pending_write is set only when outcome == "ready".
+    """
+    file_name = article.get("FileName")
+    if not file_name:
+        return "skipped", None
+
+    # Parent span: the agent/match spans below nest under it
+    with span("article", file_name=file_name, mode=mode):
+        try:
+            outcome, pending_write = _process_article(article, file_name, mode, compact)
+        except LLMOutputError as e:
+            # Unusable even after the repair turn: retried by the next run
+            log.warning(f"⚠️ {e.stage} output unusable for {file_name}: {e.reason}")
+            outcome, pending_write = "invalid", None
+        set_span_outcome(outcome)
+        return outcome, pending_write
 
 
-        print(f"\n📰 Processing: {article.get('Headline','')[:80]}")
+def _process_article(article, file_name, mode, compact):
 
-        agent1 = process_agent1(article)
-        if not agent1 or agent1["decision"] != "keep":
-            print(f"🗑 Agent1 discarded: {article.get('Headline','')[:80]}")
-            filtered_count += 1
-            continue
+    log.debug(f"📰 Processing: {article.get('Headline','')[:80]}")
+    set_llm_article(file_name)
 
-        agent2 = process_agent2(article)
+    agent1 = prefilter_article(article)
+    if agent1 is None:
+        agent1 = process_agent1(article, compact)
+
+    if not agent1 or agent1["decision"] != "keep":
+        log.debug(f"🗑 Agent1 discarded: {article.get('Headline','')[:80]}")
+        return "filtered", None
+
+    if mode == "fused":
+        fused = process_fused(article, compact)
+        if not fused:
+            return "failed", None
+        agent2, agent3 = fused
+    else:
+        agent2 = process_agent2(article, compact)
         if not agent2:
-            continue
+            return "failed", None
 
         agent3 = process_agent3(agent2)
         if not agent3:
-            continue
+            return "failed", None
 
-        notify = (
-            agent3["impact"] == "Very High" or
-            agent3["sentiment"] in ["Very Bullish", "Very Bearish"]
-        )
+    notify = (
+        agent3["impact"] == "Very High" or
+        agent3["sentiment"] in ["Very Bullish", "Very Bearish"]
+    )
 
+    clean_headline, clean_story, content_hash = normalize_article(article)
 
+    fingerprint = article.pop("_simhash", None)
+    if fingerprint is None:
+        fingerprint = article_simhash(clean_headline, clean_story)
 
-        content_hash = compute_news_hash(article)
-        clean_headline = remove_pti_references(article.get("Headline", ""))
-        clean_story = remove_pti_references(article.get("story", ""))
+    final_doc = {
+        **article,
+        "Headline": clean_headline,
+        "story": clean_story,
+        "content_hash": content_hash,
 
-        final_doc = {
-            **article,
-            "Headline": clean_headline,
-            "story": clean_story,
-            "content_hash": content_hash,
+        "decision": agent1["decision"],
+        "filter_reason": agent1.get("reason"),
 
-            "decision": agent1["decision"],
-            "filter_reason": agent1.get("reason"),
+        "summary": agent2["summary"],
 
-            "summary": agent2["summary"],
+        # ⭐ Rupee Letter Sector
+        "sector": agent2["sector"],
 
-            # ⭐ Rupee Letter Sector
-            "sector": agent2["sector"],
+        # ⭐ Trading / Market Sector
+        "sector_market": agent2.get("sector_override"),
 
-            # ⭐ Trading / Market Sector
-            "sector_market": agent2.get("sector_override"),
+        "companies": agent2["companies"],
 
-            "companies": agent2["companies"],
+        "global": agent2["global"],
 
-            "global": agent2["global"],
+        # ⭐ Commodity Boolean Flag
+        "commodities": agent2["commodities"],
 
-            # ⭐ Commodity Boolean Flag
-            "commodities": agent2["commodities"],
+        # ⭐ Actual Commodity Names
+        "commodities_market": agent2.get("commodities_override"),
 
-            # ⭐ Actual Commodity Names
-            "commodities_market": agent2.get("commodities_override"),
+        "sentiment": agent3["sentiment"],
+        "impact": agent3["impact"],
+        "impact_rationale": agent3.get("rationale"),
 
-            "sentiment": agent3["sentiment"],
-            "impact": agent3["impact"],
-            "impact_rationale": agent3.get("rationale"),
+        "pipeline_mode": mode,
+        "simhash": f"{fingerprint:016x}",
+
+        "ingested_at": datetime.now(timezone.utc)
+    }
+
+    return "ready", {
+        "doc": final_doc,
+        "article": article,
+        "agent2": agent2,
+        "agent3": agent3,
+        "notify": notify,
+    }
+
+
+def handle_write_outcome(item, status, outcomes):
+    article = item["article"]
+    if status in ("inserted", "duplicate"):
+        # Only stored articles: a failed write must reach the next poll's retry
+        remember_seen(article.get("FileName"), item["doc"]["content_hash"])
+
+    if status != "failed":
+        ingest_state.mark_processed(article, status, item.get("window_start"))
+    elif ingest_state.mark_failed(article, item.get("window_start")):
+        item["retry"] = True
+
+    if status == "inserted":
+        outcomes["stored"] += 1
+        near_dup_index.add(
+            item["doc"]["content_hash"],
+            int(item["doc"]["simhash"], 16),
+            item["doc"]["ingested_at"]
+        )
+        log.debug(f"✅ Stored new article: {article.get('Headline','')[:60]}")
+
+        if item["notify"]:
+            log.debug(f"🔔 Queued notification for: {article.get('Headline','')[:60]}")
+            notifier.enqueue(article, item["agent2"], item["agent3"])
+    elif status == "duplicate":
+        outcomes["duplicate"] += 1
+        log.debug(f"⏩ Duplicate skipped (same content): {article.get('Headline','')[:60]}")
+    else:
+        outcomes["failed"] += 1
+
+
+def run_pipeline(max_workers=None, mode=None, stop_event=None, compact=None):
+    """
+    One ingestion pass. If stop_event gets set, windows not yet fetched are
+    left for the next run while in-flight articles are drained and written.
+    compact=True/False overrides PROMPT_COMPACTION for this run only.
+    Returns a summary dict of the run.
+    """
+    if compact is None:
+        compact = PROMPT_COMPACTION
+
+    if max_workers is None:
+        max_workers = PIPELINE_MAX_WORKERS
+    max_workers = max(1, max_workers)
+
+    mode = mode or PIPELINE_MODE
+    if mode not in PIPELINE_MODES:
+        raise ValueError(f"Unknown pipeline mode: {mode} (expected one of {PIPELINE_MODES})")
+
+    started = time.perf_counter()
+    stage_stats.reset()
+    prefilter_stats.clear()
+    llm_usage.flush()
+    notifier.reset_stats()
+    start_company_refresher()
+    ingest_state.prune()
+
+    windows = plan_fetch_windows(get_last_run_time(), datetime.now(IST))
+    # Per window: fetched?, fetch failed?, articles still in flight
+    window_state = [
+        {"fetched": False, "failed": False, "retry": False, "remaining": 0} for _ in windows
+    ]
+    checkpoint_index = 0
+
+    fetched_count = 0
+    outcomes = Counter()
+    output_stats.clear()
+
+    log.info(f"📊 Fetch windows: {len(windows)} (workers={max_workers}, mode={mode})")
+
+    writer = FilteredNewsWriter()
+
+    # Near-duplicates of a story from this run wait for their original: only
+    # once it is stored are they marked processed; if it fails they are
+    # retried with it. One index for the whole run so windows see each other.
+    run_near_dups = NearDuplicateIndex(max_hamming=near_dup_index.max_hamming)
+    held_near_dups = defaultdict(list)   # original FileName → [(article, window index)]
+    settled_originals = {}               # original FileName → stored?
+
+    def settle_near_duplicates(original, stored):
+        """Release near-duplicates held on original. Returns windows that became finished."""
+        file_name = original.get("FileName")
+        settled_originals[file_name] = stored
+        finished = []
+        for duplicate, index in held_near_dups.pop(file_name, ()):
+            state = window_state[index]
+            if stored:
+                ingest_state.mark_processed(duplicate, "near_duplicate", windows[index][0])
+            elif ingest_state.mark_failed(duplicate, windows[index][0]):
+                state["retry"] = True
+            state["remaining"] -= 1
+            if state["remaining"] == 0:
+                finished.append(index)
+        return finished
+
+    def flush_writer():
+        finished = []
+        for item, status in writer.flush():
+            handle_write_outcome(item, status, outcomes)
+            if item.get("retry"):
+                window_state[item["window_index"]]["retry"] = True
+            finished += settle_near_duplicates(item["article"], status != "failed")
+        return finished
+
+    def advance_checkpoint():
+        # Move the watermark over the contiguous prefix of finished windows
+        nonlocal checkpoint_index
+        advanced = False
+        while checkpoint_index < len(windows):
+            state = window_state[checkpoint_index]
+            if state["failed"] or state["retry"] or not state["fetched"] or state["remaining"]:
+                break
+            checkpoint_index += 1
+            advanced = True
+
+        if advanced:
+            save_last_run_time(windows[checkpoint_index - 1][1])
+
+    fetch_pool = ThreadPoolExecutor(max_workers=max(PTI_FETCH_CONCURRENCY, 1))
+    article_pool = ThreadPoolExecutor(max_workers=max_workers)
 
-            "ingested_at": datetime.now(timezone.utc)
+    try:
+        future_articles = {}
+        pending = {
+            future: ("fetch", index)
+            for future, index in submit_window_fetches(fetch_pool, windows).items()
         }
 
+        while pending:
+            if stop_event is not None and stop_event.is_set():
+                # Shutting down: drop fetches that haven't started instead of
+                # waiting out their timeouts only to throw the result away
+                for future, (kind, _index) in list(pending.items()):
+                    if kind == "fetch" and future.cancel():
+                        del pending[future]
+                if not pending:
+                    break
+
+            done, _ = wait(pending, timeout=STOP_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            finished_windows = []
+
+            for future in done:
+                kind, index = pending.pop(future)
+                state = window_state[index]
+
+                if kind == "fetch":
+                    if stop_event is not None and stop_event.is_set():
+                        # Shutting down: leave this window (and the checkpoint) for next run
+                        continue
+
+                    articles = future.result()
+                    if articles is None:
+                        state["failed"] = True
+                        continue
+
+                    fetched_count += len(articles)
+                    with span("dedupe", articles=len(articles)) as dedupe_span:
+                        new_articles = drop_known_articles(articles)
+                        outcomes["known"] += len(articles) - len(new_articles)
+
+                        new_articles, near_duplicates = drop_near_duplicates(new_articles, run_near_dups)
+                        outcomes["near_duplicate"] += len(near_duplicates)
+                        dedupe_span.set(new=len(new_articles))
+
+                    state["fetched"] = True
+                    state["remaining"] = len(new_articles)
+                    for article, original in near_duplicates:
+                        if original is None or settled_originals.get(original):
+                            ingest_state.mark_processed(article, "near_duplicate", windows[index][0])
+                        elif original in settled_originals:
+                            # Original already failed this run: retry both next run
+                            if ingest_state.mark_failed(article, windows[index][0]):
+                                state["retry"] = True
+                        else:
+                            held_near_dups[original].append((article, index))
+                            state["remaining"] += 1
+
+                    log.info(f"📥 Window {index + 1}/{len(windows)}: {len(articles)} fetched, {len(new_articles)} new")
+
+                    for article in new_articles:
+                        article_future = article_pool.submit(process_article, article, mode, compact)
+                        pending[article_future] = ("article", index)
+                        future_articles[article_future] = article
+
+                    if not state["remaining"]:
+                        finished_windows.append(index)
+                    continue
+
+                article = future_articles.pop(future)
+
+                try:
+                    outcome, pending_write = future.result()
+                except Exception as e:
+                    log.error(f"❌ Article processing failed: {e}")
+                    outcome, pending_write = "failed", None
+
+                if outcome == "invalid":
+                    outcome = "failed"
+
+                state["remaining"] -= 1
+                if state["remaining"] == 0:
+                    finished_windows.append(index)
+
+                if outcome == "failed":
+                    outcomes["failed"] += 1
+                    # Hold the watermark so the next run retries just this article
+                    if ingest_state.mark_failed(article, windows[index][0]):
+                        state["retry"] = True
+                    finished_windows += settle_near_duplicates(article, False)
+                    continue
+
+                if outcome != "ready":
+                    outcomes[outcome] += 1
+                    ingest_state.mark_processed(article, outcome, windows[index][0])
+                    finished_windows += settle_near_duplicates(article, True)
+                    continue
+
+                pending_write["window_start"] = windows[index][0]
+                pending_write["window_index"] = index
+                if writer.add(pending_write):
+                    finished_windows += flush_writer()
+
+            if finished_windows:
+                # A window only counts as done once its documents are written
+                flush_writer()
+                advance_checkpoint()
+    finally:
+        fetch_pool.shutdown(wait=True, cancel_futures=True)
+        article_pool.shutdown(wait=True)
+
+    flush_writer()
+    advance_checkpoint()
+    notifier.drain()
+
+    stored_count = outcomes["stored"]
+    filtered_count = outcomes["filtered"]
+
+    log.info(f"🎯 Pipeline complete: Fetched={fetched_count}, Filtered={filtered_count}, Stored={stored_count}")
+
+    failed_windows = sum(1 for state in window_state if state["failed"])
+    if failed_windows:
+        log.warning(f"⚠️ {failed_windows} fetch window(s) failed; checkpoint held at window {checkpoint_index + 1}")
+    elif checkpoint_index < len(windows):
+        log.info(f"🔁 Checkpoint held at window {checkpoint_index + 1} for articles to retry")
+
+    elapsed = time.perf_counter() - started
+    rate = fetched_count / elapsed if elapsed > 0 else 0.0
+    log.info(
+        f"⏱ Throughput: {fetched_count} articles in {elapsed:.1f}s "
+        f"({rate:.2f} articles/s, workers={max_workers}, mode={mode}) | "
+        f"Duplicates={outcomes['duplicate']}, Near-duplicates={outcomes['near_duplicate']}, "
+        f"Failed={outcomes['failed']}, Known={outcomes['known']}"
+    )
 
-        try:
-            # Check if already exists by FileName or content_hash
-            existing = filtered_news.find_one({
-                "$or": [
-                    {"FileName": file_name},
-                    {"content_hash": content_hash}
-                ]
-            })
-            
-            if existing:
-                print("⏩ Duplicate detected - skipping")
-                continue
+    prefilter_total = prefilter_stats["keep"] + prefilter_stats["discard"] + prefilter_stats["escalated"]
+    if prefilter_total:
+        saved = prefilter_stats["keep"] + prefilter_stats["discard"]
+        log.info(
+            f"🧹 Pre-filter: discard={prefilter_stats['discard']}, keep={prefilter_stats['keep']}, "
+            f"escalated={prefilter_stats['escalated']} (company-exempt={prefilter_stats['company_exempt']}) | "
+            f"Agent1 LLM calls saved={saved}/{prefilter_total} ({saved / prefilter_total:.0%})"
+        )
 
-            result = filtered_news.update_one(
-                {"content_hash": content_hash},
-                {"$setOnInsert": final_doc},
-                upsert=True
-            )
+    if llm_cache is not None:
+        log.info(f"🗄 LLM cache: hits={llm_cache.hits}, misses={llm_cache.misses}")
 
-            if result.upserted_id:
-                stored_count += 1
-                print("✅ Stored new article")
+    if output_stats:
+        log.info(
+            f"🧾 LLM output: parsed={output_stats['parsed']}, repaired={output_stats['repaired']}, "
+            f"invalid={output_stats['invalid'] + output_stats['unparseable']}, "
+            f"repair turns={output_stats['repair_turn']}"
+        )
 
-                if notify:
-                    print(f"🔔 Sending notification for: {article.get('Headline','')[:60]}")
-                    send_push_notification(article, agent2, agent3)
-            else:
-                print("⏩ Duplicate skipped (same content)")
-        except Exception as e:
-            print(f"❌ Insert failed: {e}")
+    client_stats = llm_client.stats()
+    log.info(
+        f"🚦 OpenAI client: calls={client_stats['calls']}, retries={client_stats['retries']}, "
+        f"throttled={client_stats['throttled']}, failed={client_stats['failed']}, "
+        f"concurrency limit={client_stats['concurrency_limit']}"
+    )
 
+    usage_summary = llm_usage.summary()
+    for stage, stats in usage_summary.items():
+        live = stats["calls"] - stats["cached"]
+        log.info(
+            f"📏 {stage}: calls={stats['calls']} (cached={stats['cached']}), "
+            f"prompt={stats['prompt_tokens']}, completion={stats['completion_tokens']} tokens, "
+            f"avg latency={stats['latency_ms'] / live if live else 0:.0f} ms"
+        )
+    llm_usage.flush()
+
+    notify_stats = notifier.stats_snapshot()
+    if notify_stats:
+        log.info(
+            f"📬 Notifications: queued={notify_stats.get('queued', 0)}, "
+            f"messages={notify_stats.get('messages', 0)}, sent={notify_stats.get('sent', 0)}, "
+            f"coalesced={notify_stats.get('coalesced', 0)}, retries={notify_stats.get('retries', 0)}, "
+            f"failed={notify_stats.get('failed', 0)}"
+        )
 
-    print(f"\n🎯 Pipeline complete: Fetched={fetched_count}, Filtered={filtered_count}, Stored={stored_count}")
+    stages = stage_stats.snapshot()
+    for stage, stats in stages.items():
+        log.info(
+            f"🧵 {stage}: count={stats['count']}, p50={stats['p50_ms']:.0f} ms, "
+            f"p95={stats['p95_ms']:.0f} ms, total={stats['total_s']:.1f}s, outcomes={stats['outcomes']}"
+        )
+    push_metrics(METRICS_PUSHGATEWAY)
+
+    return {
+        "fetched": fetched_count,
+        "outcomes": dict(outcomes),
+        "elapsed_seconds": round(elapsed, 3),
+        "windows": len(windows),
+        "windows_completed": checkpoint_index,
+        "mode": mode,
+        "notifications": notify_stats,
+        "llm_usage": usage_summary,
+        "stages": stages,
+        "compaction": compact,
+    }
 
-    if stored_count == 0 and fetched_count > 0:
-        save_last_run_time(datetime.now(IST))
+
+# ================================
+# 🛰 DAEMON MODE
+# ================================
+# Keeps Mongo, OpenAI, Firebase, the company universe and the LLM cache warm
+# across runs instead of paying the import/connect cost on every cron tick.
+POLL_INTERVAL_SECONDS = int(os.getenv("POLL_INTERVAL_SECONDS", "300"))
+POLL_JITTER_SECONDS = int(os.getenv("POLL_JITTER_SECONDS", "30"))
+DAEMON_HEALTH_PORT = int(os.getenv("DAEMON_HEALTH_PORT", "8765"))
+# /metrics exposes last_error and internal state: loopback unless opted in
+DAEMON_HEALTH_HOST = os.getenv("DAEMON_HEALTH_HOST", "127.0.0.1")
+
+
+class DaemonState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = datetime.now(timezone.utc)
+        self.runs = 0
+        self.failed_runs = 0
+        self.running = False
+        self.last_run_started = None
+        self.last_run_finished = None
+        self.last_error = None
+        self.last_summary = None
+        self.totals = Counter()
+
+    def snapshot(self):
+        with self.lock:
+            universe = COMPANY_UNIVERSE
+            return {
+                "status": "running" if self.running else "idle",
+                "started_at": self.started_at.isoformat(),
+                "runs": self.runs,
+                "failed_runs": self.failed_runs,
+                "last_run_started": self.last_run_started.isoformat() if self.last_run_started else None,
+                "last_run_finished": self.last_run_finished.isoformat() if self.last_run_finished else None,
+                "last_error": self.last_error,
+                "last_summary": self.last_summary,
+                "totals": dict(self.totals),
+                "checkpoint": get_last_run_time().isoformat(),
+                "company_universe_version": universe["version"] if universe else None,
+                "llm_cache": (
+                    {"hits": llm_cache.hits, "misses": llm_cache.misses} if llm_cache is not None else None
+                ),
+            }
+
+
+def start_health_server(state, port, host=None):
+    """Serve /healthz, /metrics (JSON) and /metrics/prometheus on a background thread."""
+    host = DAEMON_HEALTH_HOST if host is None else host
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class HealthHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics/prometheus":
+                exported = prometheus_payload()
+                if exported is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                content_type, body = exported
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            if self.path not in ("/healthz", "/metrics"):
+                self.send_response(404)
+                self.end_headers()
+                return
+
+            snapshot = state.snapshot()
+            payload = {"status": snapshot["status"]} if self.path == "/healthz" else snapshot
+            body = json.dumps(payload, default=str).encode("utf-8")
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), HealthHandler)
+    threading.Thread(target=server.serve_forever, name="health-server", daemon=True).start()
+    log.info(f"🩺 Health endpoint on {host}:{port} (/healthz, /metrics, /metrics/prometheus)")
+    return server
+
+
+def run_daemon(max_workers=None, mode=None, interval=None, jitter=None, health_port=None, compact=None,
+               health_host=None):
+    interval = POLL_INTERVAL_SECONDS if interval is None else interval
+    jitter = POLL_JITTER_SECONDS if jitter is None else jitter
+    health_port = DAEMON_HEALTH_PORT if health_port is None else health_port
+
+    stop_event = threading.Event()
+    state = DaemonState()
+
+    def request_stop(signum, _frame):
+        log.info(f"🛑 Signal {signum} received - finishing in-flight articles before exit")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    server = start_health_server(state, health_port, health_host) if health_port else None
+
+    # Warm the company universe before the first poll
+    start_company_refresher()
+    get_company_universe()
+
+    log.info(f"🛰 Daemon started: every {interval}s (±{jitter}s jitter)")
+
+    try:
+        while not stop_event.is_set():
+            with state.lock:
+                state.running = True
+                state.last_run_started = datetime.now(timezone.utc)
+
+            try:
+                summary = run_pipeline(max_workers=max_workers, mode=mode, stop_event=stop_event, compact=compact)
+                with state.lock:
+                    state.last_summary = summary
+                    state.last_error = None
+                    state.totals["fetched"] += summary["fetched"]
+                    state.totals.update(summary["outcomes"])
+            except Exception as e:
+                log.error(f"❌ Pipeline run failed: {e}")
+                with state.lock:
+                    state.failed_runs += 1
+                    state.last_error = str(e)
+            finally:
+                with state.lock:
+                    state.running = False
+                    state.runs += 1
+                    state.last_run_finished = datetime.now(timezone.utc)
+
+            delay = max(0.0, interval + random.uniform(-jitter, jitter))
+            stop_event.wait(delay)
+    finally:
+        if server is not None:
+            server.shutdown()
+        if _company_refresher is not None:
+            _company_refresher.stop_event.set()
+        log.info("👋 Daemon stopped")
 
 # ================================
 # 🏁 ENTRY POINT
 # ================================
 if __name__ == "__main__":
-    run_pipeline()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="PTI → filtered_news ingestion pipeline")
+    parser.add_argument("--workers", type=int, default=None, help="articles processed concurrently")
+    parser.add_argument("--mode", choices=PIPELINE_MODES, default=None, help="staged (3 LLM calls) or fused (1 call)")
+    parser.add_argument("--compact", action="store_true", default=None, help="trim stories to LLM_INPUT_TOKEN_BUDGET tokens")
+    parser.add_argument("--daemon", action="store_true", help="keep running and poll PTI on an interval")
+    parser.add_argument("--interval", type=int, default=None, help="daemon poll interval in seconds")
+    parser.add_argument("--jitter", type=int, default=None, help="daemon poll jitter in seconds")
+    parser.add_argument("--health-port", type=int, default=None, help="daemon health/metrics port (0 = off)")
+    parser.add_argument("--health-host", default=None, help="daemon health/metrics bind address (default 127.0.0.1)")
+    parser.add_argument("--log-level", default=None, help="DEBUG logs every stage span (default LOG_LEVEL or INFO)")
+    args = parser.parse_args()
+
+    if args.log_level:
+        setup_logging(args.log_level)
+
+    if args.daemon:
+        run_daemon(
+            max_workers=args.workers,
+            mode=args.mode,
+            interval=args.interval,
+            jitter=args.jitter,
+            health_port=args.health_port,
+            compact=args.compact,
+            health_host=args.health_host,
+        )
+    else:
+        run_pipeline(max_workers=args.workers, mode=args.mode, compact=args.compact)
\ No newline at end of file
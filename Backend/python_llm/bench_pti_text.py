@@ -0,0 +1,128 @@
+"""
+Micro-benchmark: old multi-pass remove_pti_references/compute_news_hash vs
+the precompiled single-pass versions in pti_text.
+
+Usage:
+    python bench_pti_text.py pti_dump.json [more.json ...]
+    python bench_pti_text.py --synthetic 500
+
+Corpus files are raw PTI API responses (a list of articles or {"Table": [...]}),
+e.g. saved with: curl "<PTI JsonFile1 URL>" -o pti_dump.json
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import time
+
+import pti_text
+
+
+# ================================
+# 📜 ORIGINAL IMPLEMENTATION (reference)
+# ================================
+def legacy_remove_pti_references(text):
+    if not text:
+        return text
+    text = re.sub(r"\(PTI\)", "", text, flags=re.IGNORECASE)
+    text = re.sub(r"[^.]*\bPTI\b[^.]*\.", "", text, flags=re.IGNORECASE)
+    text = re.sub(r"Press Trust of India", "", text, flags=re.IGNORECASE)
+    text = re.sub(r"\bPTI\b[\sA-Z]{0,20}$", "", text.strip())
+    text = re.sub(r"\b[A-Z]{2,4}\b(?:\s+\b[A-Z]{2,4}\b)*$", "", text.strip())
+    text = re.sub(r"\s+", " ", text).strip()
+    return text
+
+
+def legacy_compute_news_hash(article):
+    text = (
+        (article.get("Headline", "") + " " + article.get("story", ""))
+        .lower()
+        .strip()
+    )
+    text = re.sub(r"\s+", " ", text)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def legacy_normalize(article):
+    return (
+        legacy_remove_pti_references(article.get("Headline", "")),
+        legacy_remove_pti_references(article.get("story", "")),
+        legacy_compute_news_hash(article),
+    )
+
+
+# ================================
+# 📚 CORPUS
+# ================================
+def load_corpus(paths):
+    articles = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = data.get("Table", [])
+        articles.extend(a for a in data if isinstance(a, dict))
+    return articles
+
+
+def synthetic_corpus(count, seed=7):
+    rng = random.Random(seed)
+    words = (
+        "shares rose crore profit quarter Sensex Nifty company board said "
+        "investors market rupee RBI policy growth revenue"
+    ).split()
+
+    articles = []
+    for i in range(count):
+        sentences = [
+            " ".join(rng.choice(words) for _ in range(rng.randint(8, 25))) + "."
+            for _ in range(rng.randint(5, 20))
+        ]
+        sentences.insert(0, "New Delhi, Jan 5 (PTI) " + sentences[0])
+        if i % 10 == 0:
+            # Long wire without periods: worst case for the old PTI-sentence regex
+            sentences = [" ".join(rng.choice(words) for _ in range(600))]
+        story = " ".join(sentences) + " PTI NKD TRB TRB"
+        articles.append({"Headline": f"Headline {i} (PTI)", "story": story})
+    return articles
+
+
+# ================================
+# ⏱ BENCHMARK
+# ================================
+def bench(fn, articles, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for article in articles:
+            fn(article)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", nargs="*", help="PTI JSON dump(s)")
+    parser.add_argument("--synthetic", type=int, default=0, help="generate N synthetic stories instead")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    articles = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.synthetic or 500)
+    if not articles:
+        raise SystemExit("Empty corpus")
+
+    mismatches = sum(1 for a in articles if legacy_normalize(a) != pti_text.normalize_article(a))
+
+    old = bench(legacy_normalize, articles, args.repeat)
+    new = bench(pti_text.normalize_article, articles, args.repeat)
+    chars = sum(len(a.get("Headline", "")) + len(a.get("story", "")) for a in articles)
+
+    print(f"📚 Corpus: {len(articles)} articles, {chars / 1e6:.2f}M chars")
+    print(f"🐢 legacy : {old * 1e3:9.2f} ms  ({old / len(articles) * 1e6:8.1f} µs/article)")
+    print(f"🚀 pti_text: {new * 1e3:9.2f} ms  ({new / len(articles) * 1e6:8.1f} µs/article)")
+    print(f"⚡ Speed-up: {old / new:.1f}x | output mismatches: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
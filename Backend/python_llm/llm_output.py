@@ -0,0 +1,218 @@
+"""
+Parsing and validation of agent JSON outputs.
+
+Responses are decoded with orjson when it is installed and checked against a
+compiled schema per agent (fastjsonschema, or the small built-in subset
+below). Common model slips — code fences, prose around the object, trailing
+commas — are repaired locally instead of paying for a second LLM call.
+Anything still unusable raises LLMOutputError so the caller can retry the
+article rather than crash the batch.
+"""
+import json
+import re
+import threading
+from collections import Counter
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+# OpenAI JSON mode: the reply is always a single JSON object
+JSON_OBJECT_FORMAT = {"type": "json_object"}
+
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL | re.IGNORECASE)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+output_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+class LLMOutputError(ValueError):
+    def __init__(self, stage, reason, raw=""):
+        super().__init__(f"{stage}: {reason}")
+        self.stage = stage
+        self.reason = reason
+        self.raw = raw
+
+
+def _count(key):
+    with _stats_lock:
+        output_stats[key] += 1
+
+
+def record_repair_turn():
+    """The caller sent a rejected reply back to the model with its error."""
+    _count("repair_turn")
+
+
+def _first_object(text):
+    """The first balanced {...} in text (string-aware), or None."""
+    start = text.find("{")
+    if start < 0:
+        return None
+
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
+def repair_json_text(text):
+    """Strip code fences and surrounding prose, drop trailing commas."""
+    fenced = _FENCE_RE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    candidate = _first_object(text)
+    if candidate is None:
+        return None
+    return _TRAILING_COMMA_RE.sub(r"\1", candidate)
+
+
+def loads_llm_json(text, stage="llm"):
+    """Decode one JSON object from model text, repairing it if needed."""
+    try:
+        return _loads(text)
+    except ValueError:
+        pass
+
+    repaired = repair_json_text(text)
+    if repaired is not None:
+        try:
+            data = _loads(repaired)
+            _count("repaired")
+            return data
+        except ValueError:
+            pass
+    _count("unparseable")
+    raise LLMOutputError(stage, "response is not valid JSON", text)
+
+
+# ================================
+# 📐 SCHEMA COMPILATION
+# ================================
+_TYPE_CHECKS = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "boolean": lambda v: isinstance(v, bool),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+}
+
+
+def _compile_subset(schema, path="$"):
+    """
+    Fallback validator for the keywords our agent schemas use: type, enum,
+    required, properties, additionalProperties=False and items.
+    """
+    checks = []
+
+    if "type" in schema:
+        type_check = _TYPE_CHECKS[schema["type"]]
+        expected = schema["type"]
+
+        def check_type(value, _at=path):
+            if not type_check(value):
+                raise ValueError(f"{_at} must be {expected}")
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = frozenset(schema["enum"])
+
+        def check_enum(value, _at=path):
+            if value not in allowed:
+                raise ValueError(f"{_at} must be one of {sorted(allowed)}")
+        checks.append(check_enum)
+
+    if schema.get("type") == "object":
+        required = tuple(schema.get("required", ()))
+        properties = {
+            name: _compile_subset(sub, f"{path}.{name}")
+            for name, sub in schema.get("properties", {}).items()
+        }
+        closed = schema.get("additionalProperties") is False
+
+        def check_object(value, _at=path):
+            for name in required:
+                if name not in value:
+                    raise ValueError(f"{_at}.{name} is required")
+            for name, item in value.items():
+                validator = properties.get(name)
+                if validator is not None:
+                    validator(item)
+                elif closed:
+                    raise ValueError(f"{_at}.{name} is not allowed")
+        checks.append(check_object)
+
+    if schema.get("type") == "array" and "items" in schema:
+        item_validator = _compile_subset(schema["items"], f"{path}[]")
+
+        def check_items(value):
+            for item in value:
+                item_validator(item)
+        checks.append(check_items)
+
+    def validate(value):
+        for check in checks:
+            check(value)
+        return value
+
+    return validate
+
+
+def compile_schema(schema):
+    """Validator callable raising ValueError on mismatch."""
+    if fastjsonschema is not None:
+        compiled = fastjsonschema.compile(schema)
+
+        def validate(value):
+            try:
+                return compiled(value)
+            except fastjsonschema.JsonSchemaException as e:
+                raise ValueError(e.message) from None
+        return validate
+    return _compile_subset(schema)
+
+
+class OutputParser:
+    """Callable: model text → validated dict for one agent, or LLMOutputError."""
+
+    def __init__(self, stage, schema):
+        self.stage = stage
+        self.schema = schema
+        self.validate = compile_schema(schema)
+
+    def __call__(self, text):
+        data = loads_llm_json(text, self.stage)
+        try:
+            self.validate(data)
+        except ValueError as e:
+            _count("invalid")
+            raise LLMOutputError(self.stage, str(e), text) from None
+        _count("parsed")
+        return data
@@ -0,0 +1,117 @@
+"""
+PTI text normalization: source-tag stripping for stored articles and the
+normalized text behind content_hash, with every pattern precompiled.
+
+remove_pti_references() gives the same output as the old six re.sub passes
+but walks the text in linear time. The old "[^.]*\\bPTI\\b[^.]*\\." pass
+backtracked quadratically on long stories without periods.
+"""
+import hashlib
+import re
+
+# Case-insensitive source tags removed inside each sentence
+PTI_PAREN_RE = re.compile(r"\(PTI\)", re.IGNORECASE)
+PTI_AGENCY_RE = re.compile(r"Press Trust of India", re.IGNORECASE)
+PTI_WORD_RE = re.compile(r"\bPTI\b", re.IGNORECASE)
+# Trailing bureau codes are matched case-sensitively, as before
+PTI_TRAILER_RE = re.compile(r"\bPTI\b")
+PTI_TRAILER_MAX_TAIL = 20
+
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == "_"
+
+
+def _strip_sentences(text):
+    """
+    Drop every period-terminated sentence mentioning PTI and remove "(PTI)" /
+    "Press Trust of India" from the rest. One split, one scan per sentence.
+    """
+    parts = text.split(".")
+    kept = []
+    last = len(parts) - 1
+
+    for i, part in enumerate(parts):
+        # Same order as the original passes: "(PTI)", PTI sentences, agency name
+        part = PTI_PAREN_RE.sub("", part)
+
+        # Only sentences that end with a period are dropped
+        if i < last and PTI_WORD_RE.search(part):
+            continue
+
+        kept.append(PTI_AGENCY_RE.sub("", part))
+        if i < last:
+            kept.append(".")
+
+    return "".join(kept)
+
+
+def _strip_pti_trailer(text):
+    """Cut a trailing "PTI <bureau codes>" (up to 20 chars of [\\sA-Z] after it)."""
+    n = len(text)
+
+    # Start of the trailing run of whitespace / uppercase letters
+    tail_start = n
+    while tail_start > 0 and (text[tail_start - 1].isspace() or "A" <= text[tail_start - 1] <= "Z"):
+        tail_start -= 1
+
+    for match in PTI_TRAILER_RE.finditer(text, max(0, n - PTI_TRAILER_MAX_TAIL - 3)):
+        end = match.end()
+        if end >= tail_start and n - end <= PTI_TRAILER_MAX_TAIL:
+            return text[:match.start()]
+    return text
+
+
+def _strip_trailing_codes(text):
+    """Cut a trailing chain of whitespace-separated 2-4 letter uppercase codes."""
+    cut = None
+    pos = len(text)
+
+    while True:
+        start = pos
+        while start > 0 and "A" <= text[start - 1] <= "Z" and pos - start <= 4:
+            start -= 1
+
+        run = pos - start
+        if run < 2 or run > 4 or (start > 0 and _is_word_char(text[start - 1])):
+            break
+        cut = start
+
+        gap = start
+        while gap > 0 and text[gap - 1].isspace():
+            gap -= 1
+        if gap == start or gap == 0:
+            break
+        pos = gap
+
+    return text if cut is None else text[:cut]
+
+
+def remove_pti_references(text):
+    if not text:
+        return text
+
+    text = _strip_sentences(text)
+    text = _strip_pti_trailer(text.strip())
+    text = _strip_trailing_codes(text.strip())
+
+    return " ".join(text.split())
+
+
+def news_hash_text(headline, story):
+    """Normalized text that content_hash is computed over."""
+    return " ".join((headline + " " + story).lower().split())
+
+
+def compute_news_hash(article):
+    text = news_hash_text(article.get("Headline", ""), article.get("story", ""))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_article(article):
+    """Returns (clean_headline, clean_story, content_hash) for one PTI article."""
+    headline = article.get("Headline", "")
+    story = article.get("story", "")
+
+    content_hash = hashlib.sha256(news_hash_text(headline, story).encode("utf-8")).hexdigest()
+    return remove_pti_references(headline), remove_pti_references(story), content_hash
@@ -0,0 +1,428 @@
+"""
+Offline replay + benchmark harness for agent1.run_pipeline.
+
+Feeds a recorded PTI JSON corpus through the real pipeline code with every
+external service replaced locally:
+  - PTI        → corpus split into fetch windows (optional simulated latency)
+  - OpenAI     → a local fake /v1/chat/completions server (recorded responses
+                 from an llm_cache.sqlite3 copy, else synthetic ones) with
+                 configurable latency
+  - MongoDB    → mongomock (default) or a local mongod via --mongo-uri;
+                 the run aborts up front if the installed mongomock can't
+                 handle agent1's bulk_write under the installed pymongo
+  - Firebase   → a stub messaging module that only counts sends
+
+Usage:
+    python replay_harness.py pti_dump.json --workers 8 --llm-latency-ms 400
+    python replay_harness.py pti_dump.json --mode fused --recorded-cache llm_cache.sqlite3
+    python replay_harness.py --synthetic 300 --json-out run_a.json
+
+Reports articles/sec, per-stage p50/p95 latency and LLM calls per article.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import types
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+COMPANY_CSV = os.path.join(BASE_DIR, "..", "..", "mcp_server", "New_Company_Data1.csv")
+
+
+# ================================
+# 🤖 FAKE OPENAI SERVER
+# ================================
+SENTIMENTS = ["Very Bullish", "Bullish", "Neutral", "Bearish", "Very Bearish"]
+IMPACTS = ["Very High", "High", "Mild", "Negligible"]
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _pick(options, seed_text, salt=""):
+    digest = hashlib.md5((salt + seed_text).encode("utf-8")).digest()
+    return options[digest[0] % len(options)]
+
+
+class FakeLLM:
+    def __init__(self, latency_ms, keep_ratio, company_names, recorded_cache=None):
+        self.latency_ms = latency_ms
+        self.keep_ratio = keep_ratio
+        self.company_names = company_names or ["Reliance Industries Limited"]
+        self.recorded = sqlite3.connect(recorded_cache, check_same_thread=False) if recorded_cache else None
+        self.recorded_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.recorded_hits = 0
+
+    def recorded_response(self, model, system_prompt, user_input, response_format):
+        if self.recorded is None:
+            return None
+        # Same key as agent1.LLMResponseCache.make_key
+        if response_format is not None:
+            system_prompt += "\n" + json.dumps(response_format, sort_keys=True)
+        key = _sha256(f"{model}\n{_sha256(system_prompt)}\n{_sha256(user_input)}")
+        with self.recorded_lock:
+            row = self.recorded.execute("SELECT response FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def synthetic_response(self, system_prompt, user_input):
+        words = user_input.split()
+        company = _pick(self.company_names, user_input, "company")
+        agent3 = {
+            "sentiment": _pick(SENTIMENTS, user_input, "sentiment"),
+            "impact": _pick(IMPACTS, user_input, "impact"),
+            "rationale": "Synthetic replay response.",
+        }
+
+        if "combined Entity Extraction" in system_prompt:
+            return {
+                "news_type": "stock", "companies": [company], "market_sector": "",
+                "commodity_names": [], "summary": " ".join(words[:50]),
+                "sector": "General Market", "global": False, "commodities": False,
+                **agent3,
+            }
+        if "You are Agent 1" in system_prompt:
+            keep = int(_sha256(user_input)[:8], 16) / 0xFFFFFFFF < self.keep_ratio
+            return {"decision": "keep" if keep else "discard", "reason": "Synthetic replay decision."}
+        if "financial entity extraction agent" in system_prompt:
+            return {"news_type": "stock", "companies": [company], "sector": "", "commodities": []}
+        if "You are Agent 2" in system_prompt:
+            return {
+                "summary": " ".join(words[:50]), "sector": "General Market",
+                "global": False, "commodities": False,
+            }
+        return agent3
+
+    def complete(self, body):
+        messages = body.get("messages", [])
+        system_prompt = next((m["content"] for m in messages if m["role"] == "system"), "")
+        user_input = next((m["content"] for m in messages if m["role"] == "user"), "")
+
+        with self.lock:
+            self.calls += 1
+
+        content = self.recorded_response(body.get("model", ""), system_prompt, user_input, body.get("response_format"))
+        if content is not None:
+            with self.lock:
+                self.recorded_hits += 1
+        else:
+            content = json.dumps(self.synthetic_response(system_prompt, user_input))
+
+        if self.latency_ms:
+            time.sleep(self.latency_ms * random.uniform(0.5, 1.5) / 1000)
+
+        prompt_tokens = (len(system_prompt) + len(user_input)) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": f"chatcmpl-replay-{self.calls}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", ""),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+
+def start_fake_openai(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; with Nagle + delayed ACK
+        # every keep-alive response would stall ~40 ms and skew stage latencies
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            payload = json.dumps(fake.complete(body)).encode("utf-8")
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.send_header("x-ratelimit-limit-requests", "10000")
+            self.send_header("x-ratelimit-remaining-requests", "9999")
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ================================
+# 🔕 STUB FIREBASE MESSAGING
+# ================================
+class _Payload:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class StubMessaging(types.SimpleNamespace):
+    def __init__(self):
+        super().__init__(Message=_Payload, MulticastMessage=_Payload, Notification=_Payload)
+        self.sent = 0
+
+    def _batch(self, count):
+        self.sent += count
+        ok = types.SimpleNamespace(success=True, exception=None)
+        return types.SimpleNamespace(success_count=count, failure_count=0, responses=[ok] * count)
+
+    def send(self, message):
+        self.sent += 1
+        return "stub"
+
+    def send_each(self, messages):
+        return self._batch(len(messages))
+
+    def send_each_for_multicast(self, message):
+        return self._batch(len(message.tokens))
+
+
+# ================================
+# 📚 CORPUS
+# ================================
+def load_corpus(paths):
+    articles = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = data.get("Table", [])
+        articles.extend(a for a in data if isinstance(a, dict))
+    return articles
+
+
+def synthetic_corpus(count, company_names, seed=11):
+    rng = random.Random(seed)
+    words = "shares rose crore profit quarter board said investors market growth revenue order".split()
+    articles = []
+    for i in range(count):
+        company = rng.choice(company_names)
+        story = f"Mumbai, Jan 5 (PTI) {company} said on Monday " + " ".join(
+            rng.choice(words) for _ in range(rng.randint(80, 300))
+        ) + ". PTI ABC DEF"
+        articles.append({
+            "FileName": f"replay-{i:06d}",
+            "Headline": f"{company} update {i}",
+            "story": story,
+            "PublishedAt": "Monday, Jan 05, 2026 10:00:00",
+        })
+    return articles
+
+
+def load_company_rows(limit=None):
+    with open(COMPANY_CSV, newline="", encoding="utf-8") as f:
+        rows = [
+            {"SYMBOL": r["SYMBOL"].strip(), "NAME OF COMPANY": r["NAME OF COMPANY"].strip()}
+            for r in csv.DictReader(f)
+            if r.get("SYMBOL") and r.get("NAME OF COMPANY")
+        ]
+    return rows[:limit] if limit else rows
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+# ================================
+# 🔌 WIRING
+# ================================
+def import_agent1(args, workdir, fake_url):
+    """Point agent1 at the local stand-ins, then import it."""
+    os.environ.update({
+        "MONGO_URI": args.mongo_uri or "mongodb://replay.invalid:27017",
+        "DB_NAME": args.db_name,
+        "OPENAI_API_KEY": "replay",
+        "OPENAI_BASE_URL": fake_url,
+        "LLM_CACHE_ENABLED": "1" if args.cache else "0",
+        "LLM_CACHE_PATH": os.path.join(workdir, "llm_cache.sqlite3"),
+        "INGEST_STATE_PATH": os.path.join(workdir, "ingest_state.sqlite3"),
+        "PREFILTER_MODEL_PATH": os.path.join(workdir, "no_model.joblib"),
+        "NOTIFY_COALESCE_SECONDS": "0",
+        "LOG_LEVEL": args.log_level,
+    })
+
+    if not args.mongo_uri:
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("mongomock is not installed: pip install mongomock, or pass --mongo-uri")
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+
+    import firebase_admin
+    from firebase_admin import credentials
+    credentials.Certificate = lambda *_args, **_kwargs: None
+    firebase_admin.initialize_app = lambda *_args, **_kwargs: None
+
+    sys.path.insert(0, BASE_DIR)
+    import agent1
+
+    agent1.messaging = StubMessaging()
+    agent1.COMPANY_SNAPSHOT_FILE = os.path.join(workdir, "company_universe.pkl")
+    return agent1
+
+
+def check_bulk_write(agent1):
+    """
+    Fail fast if the Mongo stand-in can't run FilteredNewsWriter's bulk_write
+    (e.g. mongomock against a newer pymongo rejects UpdateOne's sort argument).
+    Otherwise every insert fails and insert/notify are never exercised.
+    """
+    probe = {"content_hash": "__replay_probe__"}
+    try:
+        agent1.filtered_news.bulk_write(
+            [agent1.UpdateOne(probe, {"$setOnInsert": probe}, upsert=True)], ordered=False
+        )
+    except Exception as e:
+        raise SystemExit(
+            f"bulk_write is not supported by this Mongo stand-in ({type(e).__name__}: {e}). "
+            "Install a mongomock release that supports your pymongo version, or pass --mongo-uri."
+        )
+    finally:
+        agent1.filtered_news.delete_many(probe)
+
+
+def install_replay_fetch(agent1, articles, window_count, pti_latency_ms):
+    """Serve the corpus as window_count fetch windows."""
+    window_count = max(1, min(window_count, len(articles) or 1))
+    start = datetime.now(agent1.IST) - timedelta(minutes=window_count)
+    windows = [(start + timedelta(minutes=i), start + timedelta(minutes=i + 1)) for i in range(window_count)]
+    size = -(-len(articles) // window_count)
+    chunks = {windows[i][0]: articles[i * size:(i + 1) * size] for i in range(window_count)}
+
+    def replay_window(window_start, window_end):
+        if pti_latency_ms:
+            time.sleep(pti_latency_ms / 1000)
+        return [dict(a) for a in chunks.get(window_start, [])]
+
+    agent1.plan_fetch_windows = lambda *_args, **_kwargs: windows
+    agent1.fetch_pti_window = replay_window
+
+
+# ================================
+# 🏁 MAIN
+# ================================
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", nargs="*", help="recorded PTI JSON dump(s)")
+    parser.add_argument("--synthetic", type=int, default=0, help="generate N synthetic articles instead")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--mode", choices=("staged", "fused"), default="staged")
+    parser.add_argument("--compact", action="store_true", default=None)
+    parser.add_argument("--windows", type=int, default=4, help="fetch windows the corpus is split into")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--pti-latency-ms", type=float, default=200)
+    parser.add_argument("--keep-ratio", type=float, default=0.6, help="synthetic Agent 1 keep ratio")
+    parser.add_argument("--recorded-cache", help="llm_cache.sqlite3 to replay real responses from")
+    parser.add_argument("--cache", action="store_true", help="enable agent1's own LLM cache during the run")
+    parser.add_argument("--mongo-uri", help="local mongod instead of mongomock")
+    parser.add_argument("--db-name", default="replay_bench")
+    parser.add_argument("--log-level", default="WARNING", help="agent1 log level during the run")
+    parser.add_argument("--json-out", help="write the report as JSON for run-to-run comparison")
+    args = parser.parse_args()
+
+    companies = load_company_rows()
+    company_names = [c["NAME OF COMPANY"] for c in companies]
+    articles = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.synthetic or 200, company_names)
+    if not articles:
+        raise SystemExit("Empty corpus")
+
+    fake = FakeLLM(args.llm_latency_ms, args.keep_ratio, company_names, args.recorded_cache)
+    server = start_fake_openai(fake)
+    fake_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    with tempfile.TemporaryDirectory(prefix="agent1_replay_") as workdir:
+        agent1 = import_agent1(args, workdir, fake_url)
+
+        # Fresh state every run so results are comparable
+        agent1.filtered_news.delete_many({})
+        agent1.llm_usage_col.delete_many({})
+        agent1.companies_col.delete_many({})
+        agent1.companies_col.insert_many([dict(c) for c in companies])
+        check_bulk_write(agent1)
+
+        install_replay_fetch(agent1, articles, args.windows, args.pti_latency_ms)
+
+        started = time.perf_counter()
+        summary = agent1.run_pipeline(max_workers=args.workers, mode=args.mode, compact=args.compact)
+        elapsed = time.perf_counter() - started
+
+        usage = list(agent1.llm_usage_col.find({}, {"_id": 0, "stage": 1, "latency_ms": 1, "cached": 1}))
+        notifications = agent1.messaging.sent
+
+    server.shutdown()
+
+    stages = {}
+    for record in usage:
+        stages.setdefault(record["stage"], []).append(record["latency_ms"])
+
+    live_calls = sum(1 for r in usage if not r.get("cached"))
+    report = {
+        "articles": len(articles),
+        "workers": args.workers,
+        "mode": args.mode,
+        "elapsed_seconds": round(elapsed, 3),
+        "articles_per_second": round(len(articles) / elapsed, 2) if elapsed else 0.0,
+        "llm_calls": fake.calls,
+        "llm_calls_per_article": round(fake.calls / len(articles), 3),
+        "llm_recorded_hits": fake.recorded_hits,
+        "llm_cached_calls": len(usage) - live_calls,
+        "stages": {
+            stage: {
+                "calls": len(latencies),
+                "p50_ms": round(percentile(latencies, 50), 1),
+                "p95_ms": round(percentile(latencies, 95), 1),
+            }
+            for stage, latencies in sorted(stages.items())
+        },
+        "pipeline_stages": summary.get("stages", {}),
+        "outcomes": summary["outcomes"],
+        "notifications_sent": notifications,
+    }
+
+    print("\n================ 📊 REPLAY REPORT ================")
+    print(f"Articles        : {report['articles']} ({args.mode}, workers={args.workers})")
+    print(f"Elapsed         : {report['elapsed_seconds']} s")
+    print(f"Throughput      : {report['articles_per_second']} articles/s")
+    print(f"LLM calls       : {report['llm_calls']} ({report['llm_calls_per_article']} per article)")
+    for stage, stats in report["stages"].items():
+        print(f"  {stage:<8} calls={stats['calls']:<5} p50={stats['p50_ms']:>8} ms  p95={stats['p95_ms']:>8} ms")
+    print("Pipeline stages :")
+    for stage, stats in report["pipeline_stages"].items():
+        print(f"  {stage:<8} count={stats['count']:<5} p50={stats['p50_ms']:>8} ms  p95={stats['p95_ms']:>8} ms")
+    print(f"Outcomes        : {report['outcomes']}")
+
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"📝 Report written to {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Regression: a failed filtered_news write must be retried by the next run in
+the same process (daemon mode), not dropped as already "known".
+
+Runs agent1.run_pipeline against the replay harness stand-ins:
+    pytest test_agent1_rerun.py
+"""
+import tempfile
+import types
+
+import pytest
+
+pytest.importorskip("mongomock")
+pytest.importorskip("openai")
+pytest.importorskip("firebase_admin")
+
+import replay_harness
+
+
+@pytest.fixture(scope="module")
+def agent1():
+    companies = replay_harness.load_company_rows(limit=200)
+    company_names = [c["NAME OF COMPANY"] for c in companies]
+
+    fake = replay_harness.FakeLLM(0, 1.0, company_names)
+    server = replay_harness.start_fake_openai(fake)
+    fake_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    args = types.SimpleNamespace(mongo_uri=None, db_name="rerun_test", cache=False, log_level="WARNING")
+
+    with tempfile.TemporaryDirectory(prefix="agent1_rerun_") as workdir:
+        module = replay_harness.import_agent1(args, workdir, fake_url)
+        module.filtered_news.delete_many({})
+        module.companies_col.delete_many({})
+        module.companies_col.insert_many([dict(c) for c in companies])
+
+        articles = replay_harness.synthetic_corpus(12, company_names)
+        replay_harness.install_replay_fetch(module, articles, 2, 0)
+        yield module
+
+    server.shutdown()
+
+
+def failing_bulk_write(ops, ordered=False):
+    raise RuntimeError("simulated write outage")
+
+
+def upserting_bulk_write(collection):
+    """Plain per-op upserts, so the test doesn't depend on mongomock's bulk API."""
+    def bulk_write(ops, ordered=False):
+        upserted = {}
+        for index, op in enumerate(ops):
+            if collection.find_one(op._filter) is None:
+                collection.insert_one(dict(op._doc["$setOnInsert"]))
+                upserted[index] = None
+        return types.SimpleNamespace(upserted_ids=upserted)
+    return bulk_write
+
+
+def test_failed_write_is_retried_in_same_process(agent1, monkeypatch):
+    checkpoint = agent1.ingest_state.get("last_run_time")
+
+    monkeypatch.setattr(agent1.filtered_news, "bulk_write", failing_bulk_write, raising=False)
+    first = agent1.run_pipeline(max_workers=2)["outcomes"]
+    assert first.get("failed", 0) > 0
+    assert agent1.ingest_state.get("last_run_time") == checkpoint
+
+    second = agent1.run_pipeline(max_workers=2)["outcomes"]
+    assert second.get("known", 0) == 0
+    assert second.get("failed", 0) == first["failed"]
+    assert agent1.ingest_state.get("last_run_time") == checkpoint
+
+    monkeypatch.setattr(agent1.filtered_news, "bulk_write", upserting_bulk_write(agent1.filtered_news), raising=False)
+    third = agent1.run_pipeline(max_workers=2)["outcomes"]
+    assert third.get("stored", 0) == first["failed"]
+    assert agent1.filtered_news.count_documents({}) == first["failed"]
+    assert agent1.ingest_state.get("last_run_time") != checkpoint
@@ -0,0 +1,264 @@
+"""
+Stage-level tracing for the PTI pipeline: per-article spans (fetch, agent1,
+agent2a, match, agent2, agent3, dedupe, insert, notify) with durations, token
+counts and outcomes, exported as Prometheus metrics and OpenTelemetry spans.
+
+Both exporters are optional. Without prometheus_client the in-process
+StageStats still backs the run summary and the daemon's /metrics JSON; without
+opentelemetry the spans are only logged (at DEBUG) and counted.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter as PromCounter, Histogram as PromHistogram
+except ImportError:
+    prometheus_client = None
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+log = logging.getLogger("agent1.trace")
+
+STAGES = ("fetch", "dedupe", "article", "agent1", "agent2a", "match", "agent2", "agent3", "fused", "insert", "notify")
+STAGE_SAMPLE_SIZE = int(os.getenv("TRACE_STAGE_SAMPLES", "5000"))
+
+
+def setup_logging(level=None):
+    """Leveled logging for the worker; LOG_LEVEL (default INFO) unless level is given."""
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    logging.basicConfig(
+        level=getattr(logging, level, logging.INFO),
+        format="%(asctime)s %(levelname)-7s [%(threadName)s] %(message)s",
+        force=True,
+    )
+    # Third-party clients log every request at INFO
+    for noisy in ("httpx", "openai", "urllib3", "pymongo"):
+        logging.getLogger(noisy).setLevel(logging.WARNING)
+
+
+# ================================
+# 📈 EXPORTERS
+# ================================
+if prometheus_client is not None:
+    STAGE_SECONDS = PromHistogram(
+        "agent1_stage_duration_seconds",
+        "Duration of one pipeline stage",
+        ["stage", "outcome"],
+        buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60),
+    )
+    STAGE_TOKENS = PromCounter(
+        "agent1_llm_tokens_total",
+        "LLM tokens used per stage",
+        ["stage", "kind"],
+    )
+else:
+    STAGE_SECONDS = STAGE_TOKENS = None
+
+
+def setup_otel(service_name="agent1"):
+    """
+    Install an OTLP tracer provider when OTEL_EXPORTER_OTLP_ENDPOINT is set and
+    the SDK is available. Otherwise spans go to whatever provider is already
+    configured (e.g. by opentelemetry-instrument), or nowhere.
+    """
+    if otel_trace is None or not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        return False
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError as e:
+        log.warning(f"⚠️ OpenTelemetry SDK not available, traces not exported: {e}")
+        return False
+
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    otel_trace.set_tracer_provider(provider)
+    log.info(f"🔭 OpenTelemetry traces → {os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT')}")
+    return True
+
+
+def prometheus_payload():
+    """(content_type, body) in Prometheus text format, or None without prometheus_client."""
+    if prometheus_client is None:
+        return None
+    return prometheus_client.CONTENT_TYPE_LATEST, prometheus_client.generate_latest()
+
+
+def push_metrics(gateway, job="agent1"):
+    """Push to a Pushgateway; for one-shot (cron) runs that nothing scrapes."""
+    if prometheus_client is None or not gateway:
+        return
+    try:
+        prometheus_client.push_to_gateway(gateway, job=job, registry=prometheus_client.REGISTRY)
+    except Exception as e:
+        log.warning(f"⚠️ Metrics push to {gateway} failed: {e}")
+
+
+# ================================
+# 🧵 SPANS
+# ================================
+class StageStats:
+    """In-process per-stage durations (bounded sample), outcomes and tokens."""
+
+    def __init__(self, sample_size=STAGE_SAMPLE_SIZE):
+        self.lock = threading.Lock()
+        self.sample_size = sample_size
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.durations = defaultdict(lambda: deque(maxlen=self.sample_size))
+            self.outcomes = defaultdict(lambda: defaultdict(int))
+            self.tokens = defaultdict(lambda: {"prompt": 0, "completion": 0})
+
+    def observe(self, stage, seconds, outcome, prompt_tokens=0, completion_tokens=0):
+        with self.lock:
+            self.durations[stage].append(seconds)
+            self.outcomes[stage][outcome] += 1
+            if prompt_tokens or completion_tokens:
+                self.tokens[stage]["prompt"] += prompt_tokens
+                self.tokens[stage]["completion"] += completion_tokens
+
+    @staticmethod
+    def _percentile(ordered, pct):
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+    def snapshot(self):
+        with self.lock:
+            stages = sorted(self.durations, key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES))
+            result = {}
+            for stage in stages:
+                ordered = sorted(self.durations[stage])
+                result[stage] = {
+                    "count": sum(self.outcomes[stage].values()),
+                    "outcomes": dict(self.outcomes[stage]),
+                    "p50_ms": round(self._percentile(ordered, 50) * 1000, 1),
+                    "p95_ms": round(self._percentile(ordered, 95) * 1000, 1),
+                    "total_s": round(sum(ordered), 3),
+                    "prompt_tokens": self.tokens[stage]["prompt"],
+                    "completion_tokens": self.tokens[stage]["completion"],
+                }
+            return result
+
+
+stage_stats = StageStats()
+_span_context = threading.local()
+
+
+class Span:
+    __slots__ = ("stage", "attrs", "outcome", "prompt_tokens", "completion_tokens", "started", "otel")
+
+    def __init__(self, stage, attrs):
+        self.stage = stage
+        self.attrs = attrs
+        self.outcome = "ok"
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.started = time.perf_counter()
+        self.otel = None
+
+    def set_outcome(self, outcome):
+        self.outcome = outcome
+
+    def add_tokens(self, prompt_tokens, completion_tokens):
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+def current_span():
+    stack = getattr(_span_context, "stack", None)
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def span(stage, **attrs):
+    """
+    Time one stage. Nested spans on the same thread become children (an
+    article span holds its agent spans). An exception marks the span "error"
+    (unless an outcome was already set) and is re-raised.
+    """
+    stack = getattr(_span_context, "stack", None)
+    if stack is None:
+        stack = _span_context.stack = []
+
+    current = Span(stage, attrs)
+    otel_cm = None
+    if otel_trace is not None:
+        otel_cm = otel_trace.get_tracer("agent1").start_as_current_span(
+            stage, attributes={k: v for k, v in attrs.items() if isinstance(v, (str, int, float, bool))}
+        )
+        current.otel = otel_cm.__enter__()
+
+    stack.append(current)
+    try:
+        yield current
+    except BaseException:
+        if current.outcome == "ok":
+            current.outcome = "error"
+        raise
+    finally:
+        stack.pop()
+        _finish(current, stack[-1] if stack else None)
+        if otel_cm is not None:
+            otel_cm.__exit__(None, None, None)
+
+
+def _finish(current, parent):
+    seconds = time.perf_counter() - current.started
+    stage_stats.observe(current.stage, seconds, current.outcome, current.prompt_tokens, current.completion_tokens)
+
+    if STAGE_SECONDS is not None:
+        STAGE_SECONDS.labels(current.stage, current.outcome).observe(seconds)
+        if current.prompt_tokens:
+            STAGE_TOKENS.labels(current.stage, "prompt").inc(current.prompt_tokens)
+        if current.completion_tokens:
+            STAGE_TOKENS.labels(current.stage, "completion").inc(current.completion_tokens)
+
+    if current.otel is not None:
+        current.otel.set_attribute("outcome", current.outcome)
+        current.otel.set_attribute("llm.prompt_tokens", current.prompt_tokens)
+        current.otel.set_attribute("llm.completion_tokens", current.completion_tokens)
+        for key, value in current.attrs.items():
+            if isinstance(value, (str, int, float, bool)):
+                current.otel.set_attribute(key, value)
+
+    if log.isEnabledFor(logging.DEBUG):
+        record = {
+            "stage": current.stage,
+            "parent": parent.stage if parent else None,
+            "ms": round(seconds * 1000, 1),
+            "outcome": current.outcome,
+            **current.attrs,
+        }
+        if current.prompt_tokens or current.completion_tokens:
+            record["prompt_tokens"] = current.prompt_tokens
+            record["completion_tokens"] = current.completion_tokens
+        log.debug("span " + json.dumps(record, default=str))
+
+
+def add_span_tokens(prompt_tokens, completion_tokens):
+    current = current_span()
+    if current is not None:
+        current.add_tokens(prompt_tokens, completion_tokens)
+
+
+def set_span_outcome(outcome):
+    current = current_span()
+    if current is not None:
+        current.set_outcome(outcome)
@@ -0,0 +1,87 @@
+"""
+Benchmark: company_mapper.resolve_many vs a get_best_symbol loop over the
+same names (memo cleared before each run, so both pay for every lookup).
+
+Usage:
+    python -m mcp_server.bench_resolve_many
+    python -m mcp_server.bench_resolve_many --names 5000 --repeat-ratio 0.3
+"""
+import argparse
+import random
+import time
+from collections import Counter
+
+from mcp_server.company_mapper import CompanyMatcher
+
+
+def make_names(matcher, count, repeat_ratio, seed=7):
+    """Exact names, suffix-stripped names, typos, word and character prefixes, short inputs, noise and repeats"""
+    rng = random.Random(seed)
+    companies = list(matcher.symbol_to_name.values())
+    names = []
+
+    while len(names) < count:
+        if names and rng.random() < repeat_ratio:
+            names.append(rng.choice(names))
+            continue
+
+        name = rng.choice(companies)
+        kind = rng.randrange(7)
+        if kind == 1:
+            name = name.replace(" Limited", "").replace(" Ltd", "")
+        elif kind == 2:
+            chars = list(name.lower())
+            chars[rng.randrange(len(chars))] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+            name = "".join(chars)
+        elif kind == 3:
+            name = " ".join(name.split()[:2])
+        elif kind == 4:
+            name = "".join(rng.choice("bcdfghjklmnpqrstvwxz") for _ in range(rng.randint(5, 12)))
+        elif kind == 5:
+            # Typed-ahead prefixes: first word cut to a few characters
+            name = name.split()[0][:rng.randint(2, 5)]
+        elif kind == 6:
+            # Short ticker-like inputs, mostly not exact symbols
+            name = "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(2, 4)))
+        names.append(name)
+
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--names", type=int, default=3000)
+    parser.add_argument("--repeat-ratio", type=float, default=0.2, help="share of names repeated in the batch")
+    args = parser.parse_args()
+
+    matcher = CompanyMatcher()
+    names = make_names(matcher, args.names, args.repeat_ratio)
+
+    matcher.memo.clear()
+    started = time.perf_counter()
+    loop_symbols = [matcher.get_best_symbol(name) for name in names]
+    loop_seconds = time.perf_counter() - started
+
+    matcher.memo.clear()
+    started = time.perf_counter()
+    batch = matcher.resolve_many(names)
+    batch_seconds = time.perf_counter() - started
+
+    mismatches = [
+        (name, loop_symbol, result["symbol"], result["tier"])
+        for name, loop_symbol, result in zip(names, loop_symbols, batch)
+        if loop_symbol != result["symbol"]
+    ]
+
+    print(f"Names          : {len(names)} ({len(set(n.strip().lower() for n in names))} distinct)")
+    print(f"Loop           : {loop_seconds * 1000:.1f} ms ({loop_seconds / len(names) * 1e6:.0f} µs/name)")
+    print(f"resolve_many   : {batch_seconds * 1000:.1f} ms ({batch_seconds / len(names) * 1e6:.0f} µs/name)")
+    print(f"Speedup        : {loop_seconds / batch_seconds:.1f}x")
+    print(f"Tiers          : {dict(Counter(result['tier'] for result in batch))}")
+    print(f"Mismatches     : {len(mismatches)}")
+    for name, loop_symbol, batch_symbol, tier in mismatches[:10]:
+        print(f"  {name!r}: loop={loop_symbol} batch={batch_symbol} ({tier})")
+
+
+if __name__ == "__main__":
+    main()
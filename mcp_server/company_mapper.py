@@ -1,16 +1,134 @@
 """
 Intelligent company symbol mapping from CSV file with advanced AI-powered matching
 """
-import pandas as pd
 import os
 import re
-from typing import Dict, Optional, List, Tuple
+import heapq
+import hashlib
+import pickle
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Optional, List, Tuple
 from difflib import SequenceMatcher
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 # Load companies from CSV
 CSV_PATH = os.path.join(os.path.dirname(__file__), 'New_Company_Data1.csv')
 
+# Prebuilt index cached next to the CSV, reused while the CSV is unchanged.
+# Bump INDEX_FORMAT_VERSION whenever the indexed attributes change.
+INDEX_ARTIFACT_PATH = os.path.splitext(CSV_PATH)[0] + '.index.pkl'
+INDEX_FORMAT_VERSION = 3
+INDEX_STATE_ATTRS = (
+    'company_to_symbol', 'symbol_to_name', 'symbol_to_company', 'normalized_names',
+    'keywords_index', '_normalized_keys', '_company_keys',
+    '_company_trigrams',
+    '_company_positions', '_company_key_lengths', '_short_substrings',
+)
+
+# trigram → (start, end) into a flat int32 array of key positions
+TrigramIndex = Tuple[Dict[str, Tuple[int, int]], np.ndarray]
+
+_SUFFIX_RE = re.compile(
+    r'\b(?:limited|ltd|inc|corp|corporation|company|co|pvt|private|public|plc|llc|llp|'
+    r'industries|enterprises|group|holdings|international|india)\b'
+)
+_NON_ALNUM_RE = re.compile(r'[^a-zA-Z0-9\s]')
+_SPACES_RE = re.compile(r'\s+')
+
+# Fuzzy ranking scores this many queries per cdist call (bounds the score matrix)
+FUZZY_BATCH_ROWS = 512
+
+# Memo for get_best_symbol / search_companies: chat traffic keeps asking about
+# the same few dozen companies. Unresolvable names expire sooner.
+MEMO_MAX_ENTRIES = int(os.getenv('COMPANY_MEMO_MAX_ENTRIES', '4096'))
+MEMO_TTL_SECONDS = float(os.getenv('COMPANY_MEMO_TTL_SECONDS', '3600'))
+MEMO_NEGATIVE_TTL_SECONDS = float(os.getenv('COMPANY_MEMO_NEGATIVE_TTL_SECONDS', '300'))
+
+# Common company mappings (fallback for popular stocks)
+COMMON_MAPPINGS = {
+    'apple': 'AAPL',
+    'microsoft': 'MSFT', 
+    'google': 'GOOGL',
+    'amazon': 'AMZN',
+    'tesla': 'TSLA',
+    'sbi': 'SBIN',
+    'state bank': 'SBIN',
+    'state bank of india': 'SBIN',
+    'hdfc bank': 'HDFCBANK',
+    'icici bank': 'ICICIBANK',
+    'axis bank': 'AXISBANK',
+    'kotak bank': 'KOTAKBANK',
+    'reliance': 'RELIANCE',
+    'tcs': 'TCS',
+    'tata consultancy': 'TCS',
+    'infosys': 'INFY',
+    'wipro': 'WIPRO',
+    'hcl tech': 'HCLTECH',
+    'tech mahindra': 'TECHM'
+}
+
+
+class ResolutionMemo:
+    """Thread-safe LRU with a TTL per entry (shorter for negative results)"""
+    
+    def __init__(self, max_entries: int = MEMO_MAX_ENTRIES, ttl_seconds: float = MEMO_TTL_SECONDS,
+                 negative_ttl_seconds: float = MEMO_NEGATIVE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._entries: "OrderedDict[tuple, Tuple[float, bool, object]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key: tuple) -> Tuple[bool, object]:
+        """(found, value); expired entries count as misses"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return False, None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if entry[1]:
+                self.negative_hits += 1
+            return True, entry[2]
+    
+    def set(self, key: tuple, value, negative: bool = False):
+        ttl = self.negative_ttl_seconds if negative else self.ttl_seconds
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, negative, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+            }
+
 class CompanyMatcher:
     """Advanced company name matching with fuzzy logic and AI-like intelligence"""
     
@@ -20,69 +138,266 @@ class CompanyMatcher:
         self.symbol_to_company = {}
         self.normalized_names = {}
         self.keywords_index = defaultdict(list)
-        self.load_data()
-        self._build_search_index()
+        # Name lists in CSV order (fuzzy passes) and a trigram index over _company_keys
+        self._normalized_keys: List[str] = []
+        self._company_keys: List[str] = []
+        self._company_trigrams: TrigramIndex = ({}, np.empty(0, dtype=np.int32))
+        # Substring lookups for the partial-match tier
+        self._company_positions: Dict[str, int] = {}
+        self._company_key_lengths: List[int] = []
+        self._short_substrings: Dict[str, int] = {}
+        self.memo = ResolutionMemo()
+        self._load()
+        # Lookups run on _index, a view of the state that reload replaces but
+        # never modifies. The lock only guards taking that view and memo writes;
+        # _generation keeps answers computed on an old view out of the memo.
+        self._state_lock = threading.Lock()
+        self._generation = 0
+        self._index = self._snapshot()
+    
+    def reload(self):
+        """Re-read the CSV, build the indexes off to the side, swap them in and drop every memoized answer"""
+        fresh = CompanyMatcher()
+        with self._state_lock:
+            for attr in INDEX_STATE_ATTRS:
+                setattr(self, attr, getattr(fresh, attr))
+            self._index = self._snapshot()
+            self._generation += 1
+            self.memo.clear()
+    
+    def _snapshot(self) -> "CompanyMatcher":
+        """A matcher sharing this one's current index state and memo"""
+        snapshot = CompanyMatcher.__new__(CompanyMatcher)
+        for attr in INDEX_STATE_ATTRS:
+            setattr(snapshot, attr, getattr(self, attr))
+        snapshot.memo = self.memo
+        return snapshot
+    
+    def _current_index(self) -> Tuple["CompanyMatcher", int]:
+        with self._state_lock:
+            return self._index, self._generation
+    
+    def _memoize(self, generation: int, entries: List[Tuple[tuple, object, bool]]):
+        """Store (key, value, negative) entries unless a reload happened since generation"""
+        with self._state_lock:
+            if generation == self._generation:
+                for key, value, negative in entries:
+                    self.memo.set(key, value, negative=negative)
     
     def load_data(self):
         """Load and process company data from CSV"""
+        # Imported here: a start served from the index artifact never needs pandas
+        import pandas as pd
+        
         try:
-            df = pd.read_csv(CSV_PATH)
-            
-            for _, row in df.iterrows():
-                # Handle different CSV column formats
-                if 'NAME OF COMPANY' in df.columns:
-                    company_name = str(row['NAME OF COMPANY']).strip()
-                    symbol = str(row['SYMBOL']).strip().upper()
-                elif 'company_name' in df.columns:
-                    company_name = str(row['company_name']).strip()
-                    symbol = str(row['symbol']).strip().upper()
-                else:
-                    # Try to detect columns automatically
-                    cols = df.columns.tolist()
-                    company_name = str(row[cols[1]]).strip()  # Usually second column
-                    symbol = str(row[cols[0]]).strip().upper()  # Usually first column
-                
-                if company_name and symbol and company_name != 'nan' and symbol != 'NAN':
-                    # Store mappings
-                    company_lower = company_name.lower()
-                    self.company_to_symbol[company_lower] = symbol
-                    self.symbol_to_name[symbol] = company_name
-                    self.symbol_to_company[symbol] = company_name
-                    
-                    # Store normalized version for better matching
-                    normalized = self._normalize_company_name(company_name)
-                    self.normalized_names[normalized] = symbol
-                    
+            df = pd.read_csv(CSV_PATH, dtype=str)
         except Exception as e:
             print(f"Error loading companies CSV: {e}")
+            return
+        
+        # Handle different CSV column formats (decided once, not per row)
+        if 'NAME OF COMPANY' in df.columns:
+            name_col, symbol_col = 'NAME OF COMPANY', 'SYMBOL'
+        elif 'company_name' in df.columns:
+            name_col, symbol_col = 'company_name', 'symbol'
+        else:
+            # Usually symbol first, company name second
+            symbol_col, name_col = df.columns[0], df.columns[1]
+        
+        names = df[name_col].fillna('').str.strip()
+        symbols = df[symbol_col].fillna('').str.strip().str.upper()
+        keep = (names != '') & (symbols != '') & (names != 'nan') & (symbols != 'NAN')
+        names, symbols = names[keep], symbols[keep]
+        normalized = self._normalize_series(names)
+        
+        # Later rows win, as with the row-by-row loader
+        for company_name, company_lower, symbol, normalized_name in zip(
+            names.tolist(), names.str.lower().tolist(), symbols.tolist(), normalized.tolist()
+        ):
+            self.company_to_symbol[company_lower] = symbol
+            self.symbol_to_name[symbol] = company_name
+            self.symbol_to_company[symbol] = company_name
+            # Store normalized version for better matching
+            self.normalized_names[normalized_name] = symbol
     
     def _normalize_company_name(self, name: str) -> str:
         """Normalize company name for better matching"""
-        # Convert to lowercase
-        name = name.lower()
+        # Remove common suffixes and prefixes, then special characters and extra spaces
+        name = _SUFFIX_RE.sub('', name.lower())
+        name = _NON_ALNUM_RE.sub(' ', name)
+        return _SPACES_RE.sub(' ', name).strip()
+    
+    @staticmethod
+    def _normalize_series(names: "pd.Series") -> "pd.Series":
+        """_normalize_company_name for a whole column at once"""
+        return (
+            names.str.lower()
+            .str.replace(_SUFFIX_RE, '', regex=True)
+            .str.replace(_NON_ALNUM_RE, ' ', regex=True)
+            .str.replace(_SPACES_RE, ' ', regex=True)
+            .str.strip()
+        )
+    
+    def _index_version(self) -> Optional[Dict[str, object]]:
+        """What the index artifact must match: CSV size and mtime (hash checked on mtime change)"""
+        try:
+            stat = os.stat(CSV_PATH)
+        except OSError:
+            return None
+        return {'format': INDEX_FORMAT_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    
+    @staticmethod
+    def _csv_sha256() -> str:
+        with open(CSV_PATH, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    
+    def _load_index_artifact(self, version: Dict[str, object]) -> bool:
+        """Restore the prebuilt index if it was built from this exact CSV"""
+        try:
+            with open(INDEX_ARTIFACT_PATH, 'rb') as f:
+                artifact = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            # ImportError: pickled under another numpy (or module layout); rebuild from the CSV
+            return False
+        if not isinstance(artifact, dict) or not isinstance(artifact.get('state'), dict):
+            # Some other pickle at this path: not ours, rebuild
+            return False
         
-        # Remove common suffixes and prefixes
-        suffixes = ['limited', 'ltd', 'inc', 'corp', 'corporation', 'company', 'co', 
-                   'pvt', 'private', 'public', 'plc', 'llc', 'llp', 'industries', 
-                   'enterprises', 'group', 'holdings', 'international', 'india']
+        stored = artifact.get('version')
+        if not isinstance(stored, dict) or stored.get('format') != INDEX_FORMAT_VERSION or stored.get('size') != version['size']:
+            return False
+        if stored.get('mtime_ns') != version['mtime_ns']:
+            # Touched but possibly unchanged (e.g. a fresh checkout): compare content
+            version['sha256'] = self._csv_sha256()
+            if stored.get('sha256') != version['sha256']:
+                return False
+            self._save_index_artifact(version, artifact['state'])
         
-        for suffix in suffixes:
-            name = re.sub(rf'\b{suffix}\b', '', name)
+        for attr, value in artifact['state'].items():
+            setattr(self, attr, value)
+        self.keywords_index = defaultdict(list, self.keywords_index)
+        return True
+    
+    def _save_index_artifact(self, version: Dict[str, object], state: Optional[Dict[str, object]] = None):
+        """Write the index next to the CSV (atomically); failures only cost the next start"""
+        if state is None:
+            state = {attr: getattr(self, attr) for attr in INDEX_STATE_ATTRS}
+            state['keywords_index'] = dict(state['keywords_index'])
+        if 'sha256' not in version:
+            version['sha256'] = self._csv_sha256()
         
-        # Remove special characters and extra spaces
-        name = re.sub(r'[^a-zA-Z0-9\s]', ' ', name)
-        name = re.sub(r'\s+', ' ', name).strip()
+        tmp_path = f"{INDEX_ARTIFACT_PATH}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump({'version': version, 'state': state}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, INDEX_ARTIFACT_PATH)
+        except OSError as e:
+            print(f"Company index artifact not saved: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+    
+    def _load(self):
+        """Load from the index artifact when the CSV is unchanged, else from the CSV"""
+        version = self._index_version()
+        if version is not None and self._load_index_artifact(version):
+            return
         
-        return name
+        self.load_data()
+        self._build_search_index()
+        if version is not None and self.company_to_symbol:
+            self._save_index_artifact(version)
     
     def _build_search_index(self):
-        """Build keyword index for fast searching"""
+        """Build keyword and trigram indexes for fast searching"""
         for company_name, symbol in self.company_to_symbol.items():
             # Split into keywords
             words = self._normalize_company_name(company_name).split()
             for word in words:
                 if len(word) > 2:  # Ignore very short words
                     self.keywords_index[word].append((symbol, company_name))
+        
+        self._normalized_keys = list(self.normalized_names)
+        self._company_keys = list(self.company_to_symbol)
+        self._company_trigrams = self._build_trigram_index(self._company_keys)
+        self._build_substring_index()
+    
+    def _build_substring_index(self):
+        """
+        Lookups for the partial-match tier: key → position for "which names occur
+        inside the query", and the first position of every 1-2 character
+        substring, which are too short for the trigram postings.
+        """
+        self._company_positions = {key: position for position, key in enumerate(self._company_keys)}
+        self._company_key_lengths = sorted({len(key) for key in self._company_keys})
+        self._short_substrings = {}
+        for position, key in enumerate(self._company_keys):
+            for size in (1, 2):
+                for i in range(len(key) - size + 1):
+                    self._short_substrings.setdefault(key[i:i + size], position)
+    
+    def _build_trigram_index(self, keys: List[str]) -> TrigramIndex:
+        """
+        Inverted index: trigram → (start, end) into one flat array of key
+        positions. One array instead of one per trigram keeps the pickled
+        artifact small and fast to load.
+        """
+        postings = defaultdict(list)
+        for position, key in enumerate(keys):
+            for gram in self._trigrams(key):
+                postings[gram].append(position)
+        
+        slots = {}
+        flat = []
+        for gram, positions in postings.items():
+            slots[gram] = (len(flat), len(flat) + len(positions))
+            flat.extend(positions)
+        return slots, np.array(flat, dtype=np.int32)
+    
+    @staticmethod
+    def _trigrams(text: str) -> set:
+        """Character trigrams of text, padded so short names still produce some"""
+        padded = f"  {text} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+    
+    def _first_key_containing(self, pattern: str) -> Optional[int]:
+        """Lowest position of a company key containing pattern, or None"""
+        if len(pattern) < 3:
+            return self._short_substrings.get(pattern)
+        
+        # Every trigram of pattern is also a trigram of any key containing it;
+        # intersect postings from the rarest one and verify in position order
+        slots, flat = self._company_trigrams
+        postings = []
+        for gram in {pattern[i:i + 3] for i in range(len(pattern) - 2)}:
+            slot = slots.get(gram)
+            if slot is None:
+                return None
+            postings.append(flat[slot[0]:slot[1]])
+        postings.sort(key=len)
+        
+        candidates = postings[0]
+        for positions in postings[1:]:
+            candidates = np.intersect1d(candidates, positions, assume_unique=True)
+            if not len(candidates):
+                return None
+        for position in candidates.tolist():
+            if pattern in self._company_keys[position]:
+                return position
+        return None
+    
+    def _first_key_within(self, text: str) -> Optional[int]:
+        """Lowest position of a company key occurring inside text, or None"""
+        best = None
+        for start in range(len(text)):
+            for length in self._company_key_lengths:
+                if start + length > len(text):
+                    break
+                position = self._company_positions.get(text[start:start + length])
+                if position is not None and (best is None or position < best):
+                    best = position
+        return best
     
     def _calculate_similarity(self, str1: str, str2: str) -> float:
         """Calculate similarity between two strings"""
@@ -90,34 +405,79 @@ class CompanyMatcher:
     
     def _fuzzy_match(self, query: str, threshold: float = 0.6) -> List[Tuple[str, str, float]]:
         """Perform fuzzy matching against all company names"""
-        matches = []
-        query_normalized = self._normalize_company_name(query)
+        return [
+            (symbol, self.symbol_to_name[symbol], similarity)
+            for symbol, similarity in self._fuzzy_rank_many([query], threshold, limit=10)[0]
+        ]
+    
+    def _fuzzy_rank_many(self, queries: List[str], threshold: float, limit: int) -> List[List[Tuple[str, float]]]:
+        """
+        Top limit (symbol, similarity) per query. rapidfuzz's ratio is never below
+        SequenceMatcher's, so one cdist pass over every name safely discards most
+        of them before exact rescoring. get_best_symbol, search_companies and
+        resolve_many all rank through here, so a name resolves the same either way.
+        """
+        texts = [(self._normalize_company_name(query), query.lower()) for query in queries]
+        candidates: List[List[Tuple[float, int, int]]] = [[] for _ in queries]
         
-        # Check normalized names first
-        for normalized_name, symbol in self.normalized_names.items():
-            similarity = self._calculate_similarity(query_normalized, normalized_name)
-            if similarity >= threshold:
-                company_name = self.symbol_to_company[symbol]
-                matches.append((symbol, company_name, similarity))
+        # Normalized names first, then original names (order matters for ties)
+        for pass_order, keys in enumerate((self._normalized_keys, self._company_keys)):
+            if not keys:
+                continue
+            for start in range(0, len(texts), FUZZY_BATCH_ROWS):
+                chunk = [text[pass_order] for text in texts[start:start + FUZZY_BATCH_ROWS]]
+                scores = process.cdist(
+                    chunk, keys, scorer=fuzz.ratio, score_cutoff=threshold * 100 - 1e-6,
+                    dtype=np.float32, workers=-1 if len(chunk) > 1 else 1
+                )
+                rows, positions = np.nonzero(scores)
+                for row, position, score in zip(rows.tolist(), positions.tolist(), scores[rows, positions].tolist()):
+                    candidates[start + row].append((score / 100.0, pass_order, position))
         
-        # Check original names
-        for company_name, symbol in self.company_to_symbol.items():
-            similarity = self._calculate_similarity(query.lower(), company_name)
-            if similarity >= threshold:
-                matches.append((symbol, self.symbol_to_name[symbol], similarity))
+        return [
+            self._rank_fuzzy(text, query_candidates, threshold, limit)
+            for text, query_candidates in zip(texts, candidates)
+        ]
+    
+    def _rank_fuzzy(self, texts: Tuple[str, str], candidates: List[Tuple[float, int, int]],
+                    threshold: float, limit: int) -> List[Tuple[str, float]]:
+        """
+        Rescore (upper bound, pass, position) candidates with SequenceMatcher.
+        Returns up to limit distinct (symbol, similarity), ordered by similarity,
+        then normalized names before original names, then CSV order — exactly
+        what scoring every name would give.
+        """
+        passes = ((self._normalized_keys, self.normalized_names), (self._company_keys, self.company_to_symbol))
+        scored = []
+        best: Dict[str, float] = {}
+        kth_best = None
         
-        # Sort by similarity score (descending)
-        matches.sort(key=lambda x: x[2], reverse=True)
+        for upper_bound, pass_order, position in sorted(candidates, key=lambda c: (-c[0], c[1], c[2])):
+            # Bounds only fall from here: stop once limit symbols are out of reach
+            if kth_best is not None and upper_bound < kth_best - 1e-6:
+                break
+            keys, mapping = passes[pass_order]
+            similarity = self._calculate_similarity(texts[pass_order], keys[position])
+            if similarity < threshold:
+                continue
+            symbol = mapping[keys[position]]
+            scored.append((-similarity, pass_order, position, symbol))
+            if similarity > best.get(symbol, -1.0):
+                best[symbol] = similarity
+                if len(best) >= limit:
+                    kth_best = heapq.nlargest(limit, best.values())[-1]
         
-        # Remove duplicates while preserving order
+        # Sort by similarity score (descending), then source order; one entry per symbol
+        scored.sort()
+        ranked = []
         seen = set()
-        unique_matches = []
-        for match in matches:
-            if match[0] not in seen:
-                seen.add(match[0])
-                unique_matches.append(match)
-        
-        return unique_matches[:10]  # Return top 10 matches
+        for negative_similarity, _, _, symbol in scored:
+            if symbol not in seen:
+                seen.add(symbol)
+                ranked.append((symbol, -negative_similarity))
+                if len(ranked) == limit:
+                    break
+        return ranked
     
     def _keyword_search(self, query: str) -> List[Tuple[str, str, float]]:
         """Search using keyword matching"""
@@ -141,71 +501,129 @@ class CompanyMatcher:
         if not company_name or company_name.strip() == '':
             return ''
         
-        company_name = company_name.strip()
-        company_lower = company_name.lower()
+        # Every tier below is case-insensitive, so one memo entry per lowercased name
+        key = ('symbol', company_name.strip().lower())
+        found, resolution = self.memo.get(key)
+        if not found:
+            index, generation = self._current_index()
+            resolution = index._resolve_symbol(company_name.strip())
+            self._memoize(generation, [(key, resolution, resolution[1] == 'fallback')])
+        return resolution[0]
+    
+    def resolve_many(self, company_names: List[str]) -> List[Dict[str, object]]:
+        """
+        Resolve a batch of names. Inputs are deduplicated, the exact tiers run as
+        dict lookups and every remaining name goes through one vectorized fuzzy
+        pass. Returns one {'input', 'symbol', 'score', 'tier'} per input, in order.
+        """
+        index, generation = self._current_index()
+        results, fresh = index._resolve_many(company_names)
+        self._memoize(generation, [
+            (('symbol', key), resolution, resolution[1] == 'fallback') for key, resolution in fresh.items()
+        ])
+        return results
+    
+    def _resolve_many(self, company_names: List[str]) -> Tuple[List[Dict[str, object]], Dict[str, Tuple[str, str, float]]]:
+        """Results per input, plus the resolutions that were not memoized yet"""
+        keys = [name.strip().lower() if name else '' for name in company_names]
+        resolved: Dict[str, Tuple[str, str, float]] = {}
+        pending: Dict[str, str] = {}
         
-        # Common company mappings (fallback for popular stocks)
-        common_mappings = {
-            'apple': 'AAPL',
-            'microsoft': 'MSFT', 
-            'google': 'GOOGL',
-            'amazon': 'AMZN',
-            'tesla': 'TSLA',
-            'sbi': 'SBIN',
-            'state bank': 'SBIN',
-            'state bank of india': 'SBIN',
-            'hdfc bank': 'HDFCBANK',
-            'icici bank': 'ICICIBANK',
-            'axis bank': 'AXISBANK',
-            'kotak bank': 'KOTAKBANK',
-            'reliance': 'RELIANCE',
-            'tcs': 'TCS',
-            'tata consultancy': 'TCS',
-            'infosys': 'INFY',
-            'wipro': 'WIPRO',
-            'hcl tech': 'HCLTECH',
-            'tech mahindra': 'TECHM'
-        }
+        for name, key in zip(company_names, keys):
+            if not key or key in resolved or key in pending:
+                continue
+            found, resolution = self.memo.get(('symbol', key))
+            if found:
+                resolved[key] = resolution
+                continue
+            resolution = self._resolve_exact(name.strip())
+            if resolution is not None:
+                resolved[key] = resolution
+            else:
+                pending[key] = name.strip()
+        
+        fuzzy = self._fuzzy_rank_many(list(pending.values()), threshold=0.7, limit=1)
+        for (key, name), ranked in zip(pending.items(), fuzzy):
+            if ranked:
+                resolved[key] = (ranked[0][0], 'fuzzy', ranked[0][1])
+            else:
+                resolved[key] = self._resolve_after_fuzzy(name)
+        
+        results = []
+        for name, key in zip(company_names, keys):
+            symbol, tier, score = resolved.get(key, ('', 'empty', 0.0))
+            results.append({'input': name, 'symbol': symbol, 'score': score, 'tier': tier})
+        return results, {key: resolved[key] for key in pending}
+    
+    def _resolve_symbol(self, company_name: str) -> Tuple[str, str, float]:
+        """Run the matching cascade. Returns (symbol, tier that produced it, score)."""
+        resolution = self._resolve_exact(company_name)
+        if resolution is not None:
+            return resolution
+        
+        # 4. Fuzzy matching
+        fuzzy_matches = self._fuzzy_match(company_name, threshold=0.7)
+        if fuzzy_matches:
+            return fuzzy_matches[0][0], 'fuzzy', fuzzy_matches[0][2]  # Return best match
+        
+        return self._resolve_after_fuzzy(company_name)
+    
+    def _resolve_exact(self, company_name: str) -> Optional[Tuple[str, str, float]]:
+        """Cascade tiers that are plain dict lookups (common, exact, symbol, normalized)"""
+        company_lower = company_name.lower()
         
         # Check common mappings first
-        if company_lower in common_mappings:
-            return common_mappings[company_lower]
+        if company_lower in COMMON_MAPPINGS:
+            return COMMON_MAPPINGS[company_lower], 'common', 1.0
         
         # 1. Direct exact match
         if company_lower in self.company_to_symbol:
-            return self.company_to_symbol[company_lower]
+            return self.company_to_symbol[company_lower], 'exact', 1.0
         
         # 2. Check if it's already a symbol
         symbol_upper = company_name.upper()
         if symbol_upper in self.symbol_to_name:
-            return symbol_upper
+            return symbol_upper, 'symbol', 1.0
         
         # 3. Normalized name match
         normalized = self._normalize_company_name(company_name)
         if normalized in self.normalized_names:
-            return self.normalized_names[normalized]
+            return self.normalized_names[normalized], 'normalized', 1.0
         
-        # 4. Fuzzy matching
-        fuzzy_matches = self._fuzzy_match(company_name, threshold=0.7)
-        if fuzzy_matches:
-            return fuzzy_matches[0][0]  # Return best match
+        return None
+    
+    def _resolve_after_fuzzy(self, company_name: str) -> Tuple[str, str, float]:
+        """Cascade tiers after fuzzy matching (keyword, partial, fallback)"""
+        company_lower = company_name.lower()
         
         # 5. Keyword-based search
         keyword_matches = self._keyword_search(company_name)
         if keyword_matches:
-            return keyword_matches[0][0]  # Return best match
+            return keyword_matches[0][0], 'keyword', keyword_matches[0][2]  # Return best match
         
-        # 6. Partial matching (fallback)
-        for key, symbol in self.company_to_symbol.items():
-            if (key in company_lower or company_lower in key or 
-                any(word in key for word in company_lower.split() if len(word) > 3)):
-                return symbol
+        # 6. Partial matching (fallback): first name in CSV order that occurs in
+        # the query, contains it, or contains one of its longer words
+        positions = [self._first_key_within(company_lower), self._first_key_containing(company_lower)]
+        positions += [self._first_key_containing(word) for word in company_lower.split() if len(word) > 3]
+        positions = [position for position in positions if position is not None]
+        if positions:
+            return self.company_to_symbol[self._company_keys[min(positions)]], 'partial', 0.0
         
         # 7. Last resort: return normalized input
-        return re.sub(r'[^A-Z0-9]', '', company_name.upper())[:10]
+        return re.sub(r'[^A-Z0-9]', '', company_name.upper())[:10], 'fallback', 0.0
     
     def search_companies(self, query: str, limit: int = 10) -> List[Dict[str, str]]:
         """Search for companies with detailed results"""
+        key = ('search', query.lower(), limit)
+        found, results = self.memo.get(key)
+        if not found:
+            index, generation = self._current_index()
+            results = index._search_companies(query, limit)
+            self._memoize(generation, [(key, results, not results)])
+        # Callers may modify the result dicts; the memo keeps its own copy
+        return [dict(result) for result in results]
+    
+    def _search_companies(self, query: str, limit: int) -> List[Dict[str, str]]:
         results = []
         
         # Combine fuzzy and keyword matches
@@ -253,11 +671,12 @@ class CompanyMatcher:
     def get_symbol_info(self, symbol: str) -> Dict[str, str]:
         """Get detailed information about a symbol"""
         symbol = symbol.upper()
-        if symbol in self.symbol_to_name:
+        company_name = self.symbol_to_name.get(symbol)
+        if company_name is not None:
             return {
                 'symbol': symbol,
-                'company_name': self.symbol_to_name[symbol],
-                'normalized_name': self._normalize_company_name(self.symbol_to_name[symbol])
+                'company_name': company_name,
+                'normalized_name': self._normalize_company_name(company_name)
             }
         return {}
 
@@ -283,4 +702,16 @@ def search_companies(query: str, limit: int = 10) -> List[Dict[str, str]]:
 
 def get_symbol_info(symbol: str) -> Dict[str, str]:
     """Get detailed symbol information"""
-    return _matcher.get_symbol_info(symbol)
\ No newline at end of file
+    return _matcher.get_symbol_info(symbol)
+
+def resolve_many(company_names: List[str]) -> List[Dict[str, object]]:
+    """Resolve a list of company names in one batch (symbol, score and tier per input)"""
+    return _matcher.resolve_many(company_names)
+
+def reload_companies():
+    """Reload the company CSV and invalidate memoized lookups"""
+    _matcher.reload()
+
+def get_memo_stats() -> Dict[str, int]:
+    """Hit/miss counters of the symbol resolution memo"""
+    return _matcher.memo.stats()
\ No newline at end of file
@@ -14,6 +14,7 @@
 
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from mcp_server.llm import ask_llm
 from mcp_server.rate_limiter import check_rate_limit
@@ -35,5 +36,6 @@ class ChatRequest(BaseModel):
 @app.post("/chat")
 async def chat(req: ChatRequest, request: Request):
     #check_rate_limit(request)
-    answer = ask_llm(req.question)
+    # ask_llm blocks (LLM calls, retry sleeps): keep it off the event loop
+    answer = await run_in_threadpool(ask_llm, req.question)
     return {"answer": answer}
\ No newline at end of file
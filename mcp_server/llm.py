@@ -1,9 +1,9 @@
 import json
-from openai import OpenAI
 from datetime import datetime
 from pytz import timezone
 
 from mcp_server.config import OPENAI_API_KEY
+from mcp_server.llm_client import get_shared_llm_client
 from mcp_server.tools import (
     search_news,
     get_latest_news,
@@ -230,7 +230,8 @@ MANDATORY:
 # OPENAI CLIENT
 # ============================
 def get_openai_client():
-    return OpenAI(api_key=OPENAI_API_KEY)
+    # Shared across requests so retries/backoff and the AIMD limit see all traffic
+    return get_shared_llm_client(OPENAI_API_KEY)
 
 # ============================
 # TOOLS (LLM SEES THESE)
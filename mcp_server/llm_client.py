@@ -0,0 +1,213 @@
+"""
+Shared rate-limit-aware OpenAI client with adaptive (AIMD) concurrency.
+
+Used by the chat gateway (mcp_server/llm.py), the AI overview server
+(mcp_server_ai_overview/app.py) and the PTI ingestion worker
+(Backend/python_llm/agent1.py). Depends only on the openai package, so
+callers outside this package can import it without loading mcp_server.config.
+"""
+import logging
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import openai
+from openai import OpenAI
+
+log = logging.getLogger(__name__)
+
+# Errors worth retrying: rate limits, timeouts, dropped connections, 5xx
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+_DURATION_PART_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parse OpenAI reset headers like "1s", "6m0s", "250ms" into seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+class AIMDLimiter:
+    """Concurrency limit that grows by ~1 per window of successes and halves on throttling."""
+
+    def __init__(self, initial: float = 8, minimum: float = 1, maximum: float = 64,
+                 decrease_factor: float = 0.5, cooldown_seconds: float = 2.0):
+        self.limit = float(initial)
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.decrease_factor = decrease_factor
+        self.cooldown_seconds = cooldown_seconds
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait_for = self._paused_until - time.monotonic()
+                if wait_for <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                self._cond.wait(timeout=wait_for if wait_for > 0 else None)
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self, near_limit: bool = False):
+        with self._cond:
+            # Additive increase, unless the headers say we are about to hit the quota
+            if not near_limit:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def on_throttle(self, pause_seconds: float = 0.0):
+        with self._cond:
+            now = time.monotonic()
+            # One burst of 429s should only halve the limit once
+            if now - self._last_decrease >= self.cooldown_seconds:
+                self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                self._last_decrease = now
+            if pause_seconds > 0:
+                self._paused_until = max(self._paused_until, now + pause_seconds)
+            self._cond.notify_all()
+
+
+class _Completions:
+    def __init__(self, owner: "RateLimitedLLMClient"):
+        self._owner = owner
+
+    def create(self, **kwargs):
+        return self._owner.chat_completion(**kwargs)
+
+
+class _Chat:
+    def __init__(self, owner: "RateLimitedLLMClient"):
+        self.completions = _Completions(owner)
+
+
+class RateLimitedLLMClient:
+    """
+    Drop-in for OpenAI(...).chat.completions.create with retries and AIMD
+    concurrency. Reads x-ratelimit-* headers and retry-after on every response.
+    Blocking (limiter waits, retry sleeps): async handlers call it through
+    run_in_threadpool.
+    """
+
+    def __init__(self, client: OpenAI, max_retries: int = 6, base_delay: float = 0.5,
+                 max_delay: float = 30.0, limiter: Optional[AIMDLimiter] = None,
+                 near_limit_ratio: float = 0.05):
+        # SDK-level retries are off so every retry goes through the limiter
+        self.client = client.with_options(max_retries=0)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.near_limit_ratio = near_limit_ratio
+        self.limiter = limiter or AIMDLimiter()
+        self.chat = _Chat(self)
+
+        self._stats_lock = threading.Lock()
+        self._stats = {"calls": 0, "retries": 0, "throttled": 0, "failed": 0}
+        self.last_headers: Dict[str, str] = {}
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _near_limit(self, headers) -> bool:
+        for kind in ("requests", "tokens"):
+            try:
+                remaining = int(headers.get(f"x-ratelimit-remaining-{kind}"))
+                limit = int(headers.get(f"x-ratelimit-limit-{kind}"))
+            except (TypeError, ValueError):
+                continue
+            if limit and remaining / limit < self.near_limit_ratio:
+                return True
+        return False
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        # Full jitter, but never earlier than the server asked for
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def chat_completion(self, **kwargs) -> Any:
+        self._count("calls")
+        attempt = 0
+
+        while True:
+            self.limiter.acquire()
+            try:
+                raw = self.client.chat.completions.with_raw_response.create(**kwargs)
+            except RETRYABLE_ERRORS as e:
+                self.limiter.release()
+                headers = getattr(getattr(e, "response", None), "headers", None) or {}
+                retry_after = parse_reset_duration(headers.get("retry-after"))
+
+                if isinstance(e, openai.RateLimitError):
+                    # The quota reset time only means something for a 429;
+                    # timeouts and 5xx keep plain exponential backoff
+                    retry_after = retry_after or parse_reset_duration(headers.get("x-ratelimit-reset-requests"))
+                    self._count("throttled")
+                    self.limiter.on_throttle(retry_after or 0.0)
+
+                if attempt >= self.max_retries:
+                    self._count("failed")
+                    raise
+
+                delay = self._backoff(attempt, retry_after)
+                attempt += 1
+                self._count("retries")
+                log.warning(f"⏳ OpenAI {type(e).__name__}, retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            except Exception:
+                self.limiter.release()
+                self._count("failed")
+                raise
+
+            self.limiter.release()
+            self.last_headers = dict(raw.headers)
+            self.limiter.on_success(near_limit=self._near_limit(raw.headers))
+            return raw.parse()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["concurrency_limit"] = round(self.limiter.limit, 2)
+        stats["in_flight"] = self.limiter.in_flight
+        return stats
+
+
+_shared_clients: Dict[str, RateLimitedLLMClient] = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_llm_client(api_key: Optional[str] = None, **kwargs) -> RateLimitedLLMClient:
+    """One client (and one AIMD limiter) per API key per process."""
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    with _shared_lock:
+        if api_key not in _shared_clients:
+            _shared_clients[api_key] = RateLimitedLLMClient(OpenAI(api_key=api_key), **kwargs)
+        return _shared_clients[api_key]
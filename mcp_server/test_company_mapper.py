@@ -0,0 +1,164 @@
+"""
+Differential test: CompanyMatcher against the original matching cascade, which
+scored every company name with SequenceMatcher. Indexes, pruning and batching
+must not change any answer.
+
+    pytest mcp_server/test_company_mapper.py
+"""
+import random
+import re
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+import pytest
+
+pytest.importorskip("rapidfuzz")
+
+from mcp_server.company_mapper import COMMON_MAPPINGS, CompanyMatcher
+
+
+# ================================
+# Reference: the original cascade
+# ================================
+def reference_fuzzy_match(matcher, query, threshold):
+    def similarity(a, b):
+        return SequenceMatcher(None, a.lower(), b.lower()).ratio()
+
+    matches = []
+    query_normalized = matcher._normalize_company_name(query)
+    for normalized_name, symbol in matcher.normalized_names.items():
+        score = similarity(query_normalized, normalized_name)
+        if score >= threshold:
+            matches.append((symbol, matcher.symbol_to_company[symbol], score))
+    for company_name, symbol in matcher.company_to_symbol.items():
+        score = similarity(query.lower(), company_name)
+        if score >= threshold:
+            matches.append((symbol, matcher.symbol_to_name[symbol], score))
+    matches.sort(key=lambda x: x[2], reverse=True)
+
+    seen = set()
+    unique_matches = []
+    for match in matches:
+        if match[0] not in seen:
+            seen.add(match[0])
+            unique_matches.append(match)
+    return unique_matches[:10]
+
+
+def reference_keyword_search(matcher, query):
+    query_words = matcher._normalize_company_name(query).split()
+    matches = defaultdict(float)
+    for word in query_words:
+        for symbol, _ in matcher.keywords_index.get(word, ()):
+            matches[symbol] += 1.0 / len(query_words)
+    result = [(symbol, matcher.symbol_to_name[symbol], score) for symbol, score in matches.items()]
+    result.sort(key=lambda x: x[2], reverse=True)
+    return result[:10]
+
+
+def reference_get_best_symbol(matcher, company_name):
+    if not company_name or company_name.strip() == '':
+        return ''
+    company_name = company_name.strip()
+    company_lower = company_name.lower()
+
+    if company_lower in COMMON_MAPPINGS:
+        return COMMON_MAPPINGS[company_lower]
+    if company_lower in matcher.company_to_symbol:
+        return matcher.company_to_symbol[company_lower]
+    if company_name.upper() in matcher.symbol_to_name:
+        return company_name.upper()
+    normalized = matcher._normalize_company_name(company_name)
+    if normalized in matcher.normalized_names:
+        return matcher.normalized_names[normalized]
+
+    fuzzy_matches = reference_fuzzy_match(matcher, company_name, 0.7)
+    if fuzzy_matches:
+        return fuzzy_matches[0][0]
+    keyword_matches = reference_keyword_search(matcher, company_name)
+    if keyword_matches:
+        return keyword_matches[0][0]
+    for key, symbol in matcher.company_to_symbol.items():
+        if (key in company_lower or company_lower in key or
+                any(word in key for word in company_lower.split() if len(word) > 3)):
+            return symbol
+    return re.sub(r'[^A-Z0-9]', '', company_name.upper())[:10]
+
+
+def reference_search_companies(matcher, query, limit=10):
+    all_matches = {}
+    for symbol, name, score in reference_fuzzy_match(matcher, query, 0.4):
+        all_matches[symbol] = {'symbol': symbol, 'company_name': name, 'match_score': score, 'match_type': 'fuzzy'}
+    for symbol, name, score in reference_keyword_search(matcher, query):
+        if symbol in all_matches:
+            all_matches[symbol]['match_score'] = max(all_matches[symbol]['match_score'], score)
+            all_matches[symbol]['match_type'] = 'combined'
+        else:
+            all_matches[symbol] = {'symbol': symbol, 'company_name': name, 'match_score': score, 'match_type': 'keyword'}
+    results = list(all_matches.values())
+    results.sort(key=lambda x: x['match_score'], reverse=True)
+    return results[:limit]
+
+
+# ================================
+# Queries
+# ================================
+@pytest.fixture(scope="module")
+def matcher():
+    return CompanyMatcher()
+
+
+@pytest.fixture(scope="module")
+def queries(matcher):
+    """Exact and suffix-stripped names, typos, prefixes, short inputs and noise"""
+    rng = random.Random(3)
+    names = rng.sample(list(matcher.symbol_to_name.values()), 30)
+    queries = ['aas', 'UCAL LIMITED', 'abc', 'mds limited', 'tata', 'ind', 'xyz', 'foobar widgets', 'Reliance']
+    for name in names:
+        typo = list(name.lower())
+        typo[rng.randrange(len(typo))] = rng.choice("abcdefghij")
+        queries += [
+            name,
+            name.replace(" Limited", ""),
+            "".join(typo),
+            " ".join(name.split()[:2]),
+            name.split()[0][:rng.randint(2, 4)],
+        ]
+    return queries
+
+
+@pytest.fixture(scope="module")
+def expected_symbols(matcher, queries):
+    return [reference_get_best_symbol(matcher, q) for q in queries]
+
+
+def test_get_best_symbol_matches_reference(matcher, queries, expected_symbols):
+    matcher.memo.clear()
+    actual = [matcher.get_best_symbol(q) for q in queries]
+    assert [(q, a) for q, a, e in zip(queries, actual, expected_symbols) if a != e] == []
+
+
+def test_resolve_many_matches_reference(matcher, queries, expected_symbols):
+    matcher.memo.clear()
+    actual = [result['symbol'] for result in matcher.resolve_many(queries)]
+    assert [(q, a) for q, a, e in zip(queries, actual, expected_symbols) if a != e] == []
+
+
+def test_memoized_answer_does_not_depend_on_call_order(matcher):
+    for query in ('aas', 'UCAL LIMITED', 'tata', 'ind'):
+        matcher.memo.clear()
+        batch_first = matcher.resolve_many([query])[0]['symbol']
+        assert matcher.get_best_symbol(query) == batch_first
+        matcher.memo.clear()
+        single_first = matcher.get_best_symbol(query)
+        assert matcher.resolve_many([query])[0]['symbol'] == single_first == batch_first
+
+
+def test_search_companies_matches_reference(matcher, queries):
+    matcher.memo.clear()
+    for query in queries[::3]:
+        expected = reference_search_companies(matcher, query)
+        actual = matcher.search_companies(query)
+        assert [(r['symbol'], r['match_type']) for r in actual] == \
+            [(r['symbol'], r['match_type']) for r in expected], query
+        assert [r['match_score'] for r in actual] == pytest.approx([r['match_score'] for r in expected])
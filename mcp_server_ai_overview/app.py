@@ -1,10 +1,10 @@
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 import requests
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
 from datetime import datetime, timedelta
 import json
 import asyncio
@@ -12,6 +12,7 @@ from typing import Optional, Dict, Any, List
 import uvicorn
 from functools import lru_cache
 import hashlib
+import sys
 
 # MCP SDK imports
 try:
@@ -44,9 +45,13 @@ OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
 FINEDGE_API_TOKEN = os.getenv('FINEDGE_API_TOKEN', '')
 
+# Shared rate-limit-aware client lives in mcp_server/llm_client.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mcp_server.llm_client import get_shared_llm_client
+
 # Initialize OpenAI client
 try:
-    openai_client = OpenAI(api_key=OPENAI_API_KEY)
+    openai_client = get_shared_llm_client(OPENAI_API_KEY)
     print("✓ OpenAI client initialized successfully")
 except Exception as e:
     print(f"✗ Error initializing OpenAI client: {e}")
@@ -481,7 +486,7 @@ P/B Ratio: {valuation.get('pb_ratio', 'N/A')}
 
 async def generate_llm_overview_async(company_name: str, symbol: str, financial_context: str) -> str:
     """Async wrapper for LLM generation"""
-    return generate_llm_overview(company_name, symbol, financial_context)
+    return await run_in_threadpool(generate_llm_overview, company_name, symbol, financial_context)
 
 def generate_llm_overview(company_name: str, symbol: str, financial_context: str) -> str:
     """Generate structured 3-paragraph company overview using OpenAI"""
@@ -724,7 +729,7 @@ async def get_ai_overview(
         formatted_context = format_financial_context_for_llm(financials, company_name, symbol)
         print("🤖 Feeding MCP context to Azure OpenAI LLM...")
         
-        ai_overview = generate_llm_overview(company_name, symbol, formatted_context)
+        ai_overview = await generate_llm_overview_async(company_name, symbol, formatted_context)
         
         if ai_overview and not ai_overview.startswith("Error"):
             print("✓ AI Overview generated via MCP protocol")
@@ -789,7 +794,7 @@ async def get_ai_insight(
         financials = fetch_comprehensive_financials(symbol)
         
         # Generate insight
-        ai_insight = generate_ai_insight(financials)
+        ai_insight = await run_in_threadpool(generate_ai_insight, financials)
         
         result = {
             'success': True,